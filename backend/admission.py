@@ -0,0 +1,134 @@
+# File: backend/admission.py
+# Priority-aware admission control in front of provider (LLM) calls.
+#
+# Every provider call takes a slot from a shared pool of `capacity` slots. Each priority class
+# may hold at most its share of slots at once, and has a bounded wait queue; when the queue is
+# full the request is shed immediately with a Retry-After hint instead of piling up.
+# Freed slots always go to the highest-priority waiter first. Background shares are kept below
+# the total capacity so interactive requests always have headroom.
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+ANALYSIS = "analysis"
+PRIORITY_ORDER = (INTERACTIVE, BATCH, ANALYSIS)
+
+
+class Overloaded(Exception):
+    def __init__(self, priority, retry_after):
+        super().__init__(f"Too many queued '{priority}' requests, retry after {retry_after}s")
+        self.priority = priority
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, capacity, shares, queue_limits):
+        self.capacity = capacity
+        self.shares = dict(shares)
+        self.queue_limits = dict(queue_limits)
+        self.running = {priority: 0 for priority in PRIORITY_ORDER}
+        self.waiting = {priority: deque() for priority in PRIORITY_ORDER}
+        # Smoothed slot hold time per class, used for the Retry-After estimate.
+        self._avg_hold = {priority: 5.0 for priority in PRIORITY_ORDER}
+
+    @classmethod
+    def from_env(cls):
+        capacity = int(os.getenv("SCHEDULER_CAPACITY", "8"))
+        shares = {
+            INTERACTIVE: int(os.getenv("SCHEDULER_SHARE_INTERACTIVE", str(capacity))),
+            BATCH: int(os.getenv("SCHEDULER_SHARE_BATCH", str(max(1, capacity // 2)))),
+            ANALYSIS: int(os.getenv("SCHEDULER_SHARE_ANALYSIS", "1")),
+        }
+        queue_limits = {
+            INTERACTIVE: int(os.getenv("SCHEDULER_QUEUE_INTERACTIVE", "32")),
+            BATCH: int(os.getenv("SCHEDULER_QUEUE_BATCH", "16")),
+            ANALYSIS: int(os.getenv("SCHEDULER_QUEUE_ANALYSIS", "2")),
+        }
+        return cls(capacity, shares, queue_limits)
+
+    def _total_running(self):
+        return sum(self.running.values())
+
+    def _can_start(self, priority):
+        return self._total_running() < self.capacity and self.running[priority] < self.shares[priority]
+
+    def _retry_after(self, priority):
+        backlog = len(self.waiting[priority]) + self.running[priority]
+        return max(1, math.ceil(backlog * self._avg_hold[priority] / max(1, self.shares[priority])))
+
+    def _dispatch(self):
+        # Hand freed slots to waiters, highest priority first.
+        for priority in PRIORITY_ORDER:
+            queue = self.waiting[priority]
+            while queue and self._can_start(priority):
+                future = queue.popleft()
+                if future.done():
+                    continue  # waiter gave up
+                self.running[priority] += 1
+                future.set_result(None)
+
+    async def acquire(self, priority, timeout=None):
+        if priority not in self.running:
+            raise ValueError(f"Unknown priority class: {priority}")
+        # Serve existing waiters first so a free slot can't jump ahead of a higher-priority waiter.
+        # Anyone still waiting after that can't start, so if this request can, it needn't queue.
+        self._dispatch()
+        if self._can_start(priority):
+            self.running[priority] += 1
+            return
+
+        # The queue limit only applies to requests that would actually wait (so a limit of 0
+        # means "admit when a slot is free, never queue").
+        if len(self.waiting[priority]) >= self.queue_limits[priority]:
+            raise Overloaded(priority, self._retry_after(priority))
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[priority].append(future)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # The slot was granted just as we gave up; hand it back.
+                self.release(priority)
+            else:
+                future.cancel()
+                try:
+                    self.waiting[priority].remove(future)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                raise Overloaded(priority, self._retry_after(priority)) from None
+            raise
+
+    def release(self, priority, held_for=None):
+        self.running[priority] -= 1
+        if held_for is not None:
+            self._avg_hold[priority] = 0.8 * self._avg_hold[priority] + 0.2 * held_for
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority, timeout=None):
+        await self.acquire(priority, timeout)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(priority, time.monotonic() - started)
+
+    def snapshot(self):
+        return {
+            "capacity": self.capacity,
+            "classes": {
+                priority: {
+                    "running": self.running[priority],
+                    "queued": len(self.waiting[priority]),
+                    "share": self.shares[priority],
+                    "queue_limit": self.queue_limits[priority],
+                }
+                for priority in PRIORITY_ORDER
+            },
+        }
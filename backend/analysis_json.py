@@ -0,0 +1,281 @@
+# File: backend/analysis_json.py
+# Tolerant parsing of the GPT-4 prompt analysis JSON.
+#
+# GPT-4 output occasionally comes wrapped in markdown fences, with // comments, trailing
+# commas or a truncated tail. Rather than failing the whole (expensive) analysis, the output
+# is repaired where possible, validated against the expected schema, and whatever is valid is
+# salvaged. If a required field is still malformed, only that fragment needs to go back to a model
+# for a syntax fix. Cut-off values are never sent: a model would have to invent the missing rest.
+import json
+import re
+
+REQUIRED_FIELDS = {
+    "overall_summary": str,
+    "tone_effectiveness_analysis": dict,
+    "improvement_suggestions": list,
+    "revised_base_prompt": str,
+}
+
+_OPENING_FENCE_RE = re.compile(r"^\s*```[\w-]*[ \t]*\n?")
+_CLOSING_FENCE_RE = re.compile(r"\n?[ \t]*```\s*$")
+_PY_LITERALS = {"None": "null", "True": "true", "False": "false"}
+MAX_TRIM_ATTEMPTS = 50
+
+
+def _strip_fences(text):
+    """
+    Removes a leading opening and a trailing closing markdown fence (fences inside string values
+    are left alone) and any text before the first '{'. Returns None if there is no object.
+    """
+    text = _CLOSING_FENCE_RE.sub("", _OPENING_FENCE_RE.sub("", text, count=1), count=1).strip()
+    start = text.find("{")
+    return text[start:] if start != -1 else None
+
+
+def _skip_ws_and_comments(text, j):
+    n = len(text)
+    while j < n:
+        if text[j] in " \t\r\n":
+            j += 1
+        elif text.startswith("//", j):
+            newline = text.find("\n", j)
+            j = n if newline == -1 else newline
+        elif text.startswith("/*", j):
+            close = text.find("*/", j + 2)
+            j = n if close == -1 else close + 2
+        else:
+            break
+    return j
+
+
+def _clean(text):
+    """
+    One pass over the text outside string literals: drops // and /* */ comments and trailing
+    commas, maps Python literals to JSON, and escapes raw newlines inside strings.
+    """
+    out = []
+    i, n = 0, len(text)
+    in_string = False
+    while i < n:
+        c = text[i]
+        if in_string:
+            if c == "\\" and i + 1 < n:
+                out.append(text[i:i + 2])
+                i += 2
+                continue
+            if c == '"':
+                in_string = False
+            elif c == "\n":
+                c = "\\n"
+            elif c == "\t":
+                c = "\\t"
+            out.append(c)
+            i += 1
+            continue
+
+        if c == '"':
+            in_string = True
+        elif text.startswith("//", i):
+            newline = text.find("\n", i)
+            i = n if newline == -1 else newline
+            continue
+        elif text.startswith("/*", i):
+            close = text.find("*/", i + 2)
+            i = n if close == -1 else close + 2
+            continue
+        elif c == ",":
+            j = _skip_ws_and_comments(text, i + 1)
+            if j < n and text[j] in "}]":
+                i += 1
+                continue
+        elif c.isalpha():
+            j = i
+            while j < n and text[j].isalnum():
+                j += 1
+            word = text[i:j]
+            out.append(_PY_LITERALS.get(word, word))
+            i = j
+            continue
+        out.append(c)
+        i += 1
+    return "".join(out)
+
+
+def _close_truncated(text):
+    """
+    Closes an unterminated string and any open brackets at the end of a truncated object.
+    Returns (text, value_cut_off) where `value_cut_off` means the last top-level value itself
+    (not just the outer object) was left open.
+    """
+    stack = []
+    in_string = escaped = False
+    for c in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c in "{[":
+            stack.append("}" if c == "{" else "]")
+        elif c in "}]" and stack:
+            stack.pop()
+    value_cut_off = in_string or len(stack) > 1
+    if in_string:
+        text = text[:-1] if escaped else text
+        text += '"'
+    text = text.rstrip().rstrip(",")
+    if text.endswith(":"):
+        text += " null"
+    return text + "".join(reversed(stack)), value_cut_off
+
+
+def _loads_salvaging(text, issues):
+    """
+    Tries to parse `text`, trimming back to earlier value boundaries if the tail is broken.
+    Returns (data, truncated) where `truncated` means the last value had to be closed off.
+    """
+    decoder = json.JSONDecoder()
+    try:
+        # A complete object followed by stray prose
+        return decoder.raw_decode(text)[0], False
+    except json.JSONDecodeError:
+        pass
+
+    candidate = text
+    for attempt in range(MAX_TRIM_ATTEMPTS):
+        closed, truncated = _close_truncated(candidate)
+        try:
+            return json.loads(closed), truncated
+        except json.JSONDecodeError:
+            pass
+        # Drop the last (broken) member and try again
+        cut = max(candidate.rfind(","), candidate.rfind("{", 0, len(candidate) - 1), candidate.rfind("[", 0, len(candidate) - 1))
+        if cut <= 0:
+            break
+        candidate = candidate[:cut] if candidate[cut] == "," else candidate[:cut + 1]
+        if attempt == 0:
+            issues.append("Dropped a malformed or truncated tail")
+    return None, True
+
+
+def _validate(data, issues):
+    """Keeps the fields that match the expected schema and reports the ones that don't."""
+    result, missing = {}, []
+    for field, expected in REQUIRED_FIELDS.items():
+        value = data.get(field)
+        if isinstance(value, expected):
+            result[field] = value
+        else:
+            missing.append(field)
+
+    if "tone_effectiveness_analysis" in result:
+        result["tone_effectiveness_analysis"] = {
+            tone: text if isinstance(text, str) else json.dumps(text)
+            for tone, text in result["tone_effectiveness_analysis"].items()
+        }
+
+    if "improvement_suggestions" in result:
+        valid = [
+            s for s in result["improvement_suggestions"]
+            if isinstance(s, dict) and s.get("component_type") in ("base", "tone")
+            and isinstance(s.get("suggested_replacement_text"), str)
+        ]
+        if len(valid) != len(result["improvement_suggestions"]):
+            issues.append(f"Dropped {len(result['improvement_suggestions']) - len(valid)} malformed suggestion(s)")
+        result["improvement_suggestions"] = valid
+
+    # Keep any extra keys the model added
+    for key, value in data.items():
+        if key not in REQUIRED_FIELDS:
+            result[key] = value
+    return result, missing
+
+
+def parse_analysis(raw):
+    """
+    Returns (result, status). `result` holds every field that could be recovered (None if
+    nothing could be); `status` reports whether repair was needed and what is still missing.
+    """
+    issues = []
+    data = None
+    truncated = False
+    try:
+        data = json.loads(raw)
+    except (json.JSONDecodeError, TypeError):
+        body = _strip_fences(raw or "")
+        if body is None:
+            issues.append("No JSON object found in the output")
+        else:
+            issues.append("Output was not valid JSON and was repaired")
+            data, truncated = _loads_salvaging(_clean(body), issues)
+
+    cut_off = _cut_off_fields(raw, truncated)
+    if not isinstance(data, dict):
+        return None, {"repaired": bool(issues), "partial": True, "missing": list(REQUIRED_FIELDS),
+                      "cut_off": cut_off, "issues": issues}
+
+    if truncated and data:
+        # The last field was cut off, and nothing cut off may be offered as if whole (e.g. half a
+        # revised base prompt, or half a suggestion's replacement text): a cut-off string is dropped,
+        # and a cut-off list or object loses its last (cut-off) element.
+        last_field = list(data)[-1]
+        issues.append(f"'{last_field}' was cut off")
+        value = data[last_field]
+        if isinstance(value, list) and value:
+            value.pop()
+        elif isinstance(value, dict) and value:
+            value.pop(list(value)[-1])
+        else:
+            del data[last_field]
+
+    result, missing = _validate(data, issues)
+    return result, {"repaired": bool(issues), "partial": bool(missing), "missing": missing,
+                    "cut_off": cut_off, "issues": issues}
+
+
+def _cut_off_fields(raw, truncated):
+    """The required field the output was cut off in: the one whose key appears last in it."""
+    body = _strip_fences(raw or "") or ""
+    # An output that still ends with its closing brace wasn't cut off, only malformed
+    if not truncated or body.rstrip().endswith("}"):
+        return []
+    positions = {field: (raw or "").rfind(f'"{field}"') for field in REQUIRED_FIELDS}
+    positions = {field: p for field, p in positions.items() if p != -1}
+    return [max(positions, key=positions.get)] if positions else []
+
+
+def repairable_fields(status):
+    """Missing fields that are complete in the raw output and only need a syntax fix."""
+    return [field for field in status["missing"] if field not in status["cut_off"]]
+
+
+def broken_fragment(raw, fields, cut_off=()):
+    """
+    The part of the raw output holding `fields`, from the first of them up to any cut-off field.
+    Returns None if the model never produced them (so there is nothing to repair).
+    """
+    end = len(raw)
+    for field in cut_off:
+        cut_at = raw.rfind(f'"{field}"')
+        if cut_at != -1:
+            end = min(end, cut_at)
+    positions = [raw.find(f'"{field}"') for field in fields]
+    positions = [p for p in positions if p != -1 and p < end]
+    if not positions:
+        return None
+    return raw[min(positions):end]
+
+
+def build_fragment_repair_prompt(fragment, fields):
+    keys = ", ".join(f'"{field}"' for field in fields)
+    return f"""The following is a fragment of a JSON object with syntax errors:
+
+--- BEGIN FRAGMENT ---
+{fragment}
+--- END FRAGMENT ---
+
+Return a single valid JSON object containing only the keys {keys}, with their values from the fragment. Fix JSON syntax errors only: do not add, complete, reword or remove any content. If a value is incomplete, leave its key out. Do not include markdown formatting, comments or any other text."""
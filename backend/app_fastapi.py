@@ -1,9 +1,9 @@
 import os
 from dotenv import load_dotenv
 import google.generativeai as genai
-import requests
-from fastapi import FastAPI, Request, status
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import BackgroundTasks, FastAPI, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
@@ -14,25 +14,61 @@ import json
 from datetime import datetime
 import openai
 import sqlite3 # Added import
+import time
+from typing import List, Optional
+
+# Load env vars before importing local modules, which read their settings at import time
+load_dotenv()
 
 from database.prompt_db import PromptDatabase # Added import
+from similarity_index import SimilarityIndex, details_match, prompt_version
+from prompt_builder import (
+    FALLBACK_BASE_PROMPT, build_rewrite_prompt, build_multi_tone_prompt,
+    parse_rewrite_response, split_multi_tone_response
+)
+from deadlines import (
+    ANALYSIS_DEADLINE_SECONDS, PROVIDER_CONNECT_TIMEOUT, REWRITE_DEADLINE_SECONDS,
+    ClientDisconnected, DeadlineExceeded, provider_timeout, resolve_deadline, run_with_deadline
+)
+from admission import ANALYSIS, BATCH, INTERACTIVE, AdmissionController, Overloaded
+import profiling
+from profiling import span
+import provider_clients
+from email_preprocess import preprocess_email, reattach
+from history_stats import HistoryStats
+from analysis_json import broken_fragment, build_fragment_repair_prompt, parse_analysis, repairable_fields
 
 LOG_PATH = Path("rewrite_history.json")
+SIMILARITY_INDEX_PATH = Path("similarity_index.jsonl")
+STATS_PATH = Path("rewrite_stats.json")
+
+# Usage aggregates, updated as each rewrite is logged so /history/stats never scans the log
+history_stats = HistoryStats(stats_path=STATS_PATH)
 
 def log_rewrite(entry: dict):
-    if LOG_PATH.exists():
-        with open(LOG_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    else:
-        data = []
+    with span("log_read", path=str(LOG_PATH)):
+        if LOG_PATH.exists():
+            with open(LOG_PATH, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        else:
+            data = []
 
     data.append(entry)
 
-    with open(LOG_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+    with span("log_write", path=str(LOG_PATH), entries=len(data)):
+        with open(LOG_PATH, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+
+    history_stats.record_rewrite(entry)
+
+def record_rewrite_failure(tones, e: Exception):
+    # Client disconnects aren't failures of the service, so they aren't counted
+    if isinstance(e, ClientDisconnected):
+        return
+    reason = "deadline" if isinstance(e, DeadlineExceeded) else "overloaded" if isinstance(e, Overloaded) else "error"
+    for tone in tones:
+        history_stats.record_failure(tone, reason)
 
-# Load env vars
-load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY not found in environment variables")
@@ -43,17 +79,45 @@ if not openai.api_key:
 
 
 # Configure Gemini model
-genai.configure(api_key=GEMINI_API_KEY)
+provider_clients.configure_gemini(GEMINI_API_KEY)
 model = genai.GenerativeModel("models/gemini-2.0-flash")
 
 # Initialize database connection
 # Ensure this path correctly points to where you want the database file to live.
 # If app_fastapi.py is in /backend, and prompts.db should be in /backend/database/prompts.db
 db_path = Path(__file__).parent / "database" / "prompts.db"
-db = PromptDatabase(db_path=str(db_path))
+db = PromptDatabase(db_path=str(db_path), query_timer=profiling.sql_span)
+
+# Near-duplicate lookup over previous rewrites (offline MinHash/LSH, no embedding service)
+SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.75"))
+similarity_index = SimilarityIndex(index_path=SIMILARITY_INDEX_PATH)
+
+def index_rewrites(email_body: str, rewrites: list, signature=None):
+    """
+    Adds (tone, version, rewritten) rewrites of one email to the similarity index.
+    Run as a background task: the MinHash signature and file append are blocking work.
+    """
+    if signature is None:
+        signature = similarity_index.signature(email_body)
+    for tone, version, rewritten in rewrites:
+        similarity_index.add(email_body, tone, version, rewritten, signature=signature)
+
+# Admission control in front of provider calls: interactive rewrites are served first,
+# batch rewrites and GPT-4 analyses only use their share of capacity.
+scheduler = AdmissionController.from_env()
+PRIORITY_HEADER = "X-Request-Priority"  # 'batch' lets bulk callers of /rewrite step aside for interactive users
 
 app = FastAPI()
 
+@app.on_event("startup")
+async def startup_provider_clients():
+    # Pooled keep-alive connections are opened once here and reused by every request
+    await provider_clients.startup()
+
+@app.on_event("shutdown")
+async def shutdown_provider_clients():
+    await provider_clients.shutdown()
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Or replace with your frontend origin if needed
@@ -62,6 +126,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Plain ASGI middleware, so client disconnects still reach request.is_disconnected()
+app.add_middleware(profiling.ProfilingMiddleware)
+
 # Set up templates and static files
 templates = Jinja2Templates(directory="templates")
 BASE_DIR = Path(__file__).resolve().parent.parent  # goes up from /backend
@@ -73,6 +140,9 @@ class PromptAnalysisRequest(BaseModel):
 class EmailRequest(BaseModel):
     email: str
     tone: str = "professional"
+    reuse_similar: Optional[str] = None  # None (off), 'return' (reuse prior rewrite) or 'draft' (use it as a starting draft)
+    tones: Optional[List[str]] = None    # If set, rewrite in all these tones with one LLM call ('tone' is ignored)
+    preprocess: bool = True              # Strip quoted threads, signatures and disclaimers before prompting
 
 class BasePromptUpdateRequest(BaseModel):
     content: str
@@ -93,60 +163,119 @@ class ApplySuggestionRequest(BaseModel):
     new_content: str
     reason: str                 # Reason for applying the suggestion
 
+async def generate_with_deadline(prompt: str, request: Request, deadline: float, priority: str = INTERACTIVE) -> str:
+    """
+    Calls Gemini once admitted by the scheduler, cancelling the call if the deadline passes
+    or the client disconnects.
+    """
+    async with scheduler.slot(priority, timeout=max(0.0, deadline - time.monotonic())):
+        with span("provider", provider="gemini", prompt_chars=len(prompt)):
+            response = await run_with_deadline(
+                model.generate_content_async(prompt, request_options={"timeout": provider_timeout(deadline)}),
+                request, deadline
+            )
+    return response.text
+
+def rewrite_priority(request: Request) -> str:
+    return BATCH if request.headers.get(PRIORITY_HEADER, "").lower() == BATCH else INTERACTIVE
+
+def overloaded_response(e: Overloaded):
+    print(f"WARNING: Shedding load: {e}")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"error": "The server is busy. Please try again shortly."},
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+def deadline_error_response(e: Exception, endpoint: str):
+    if isinstance(e, ClientDisconnected):
+        # Nobody is listening any more; 499 is the conventional "client closed request" code.
+        print(f"INFO: Client disconnected during {endpoint}, provider call cancelled and nothing logged.")
+        return Response(status_code=499)
+    print(f"WARNING: Deadline exceeded during {endpoint}, provider call cancelled.")
+    return JSONResponse(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        content={"error": "The request took longer than its deadline and was cancelled. Please try again."}
+    )
+
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 @app.post("/rewrite")
-async def rewrite_email(email_request: EmailRequest):
+async def rewrite_email(email_request: EmailRequest, request: Request, background_tasks: BackgroundTasks):
+    if email_request.reuse_similar not in (None, "return", "draft"):
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"error": f"Invalid reuse_similar: {email_request.reuse_similar}. Must be 'return' or 'draft'."}
+        )
+
     active_base_prompt = db.get_active_base_prompt()
     if not active_base_prompt:
         # Fallback if no active base prompt is found
-        active_base_prompt = "You are a helpful writing assistant. Please rewrite the provided email."
+        active_base_prompt = FALLBACK_BASE_PROMPT
         # Consider logging this event.
         print("WARNING: No active base prompt found in DB, using fallback for /rewrite endpoint.")
 
+    deadline = resolve_deadline(request, REWRITE_DEADLINE_SECONDS)
+
+    # Only the email body goes into the prompt; stripped parts are re-attached to the output
+    preprocessed = None
+    email_body = email_request.email
+    if email_request.preprocess:
+        with span("preprocess"):
+            preprocessed = preprocess_email(email_request.email)
+        email_body = preprocessed.body
+
+    if email_request.tones:
+        return await rewrite_multi_tone(email_request, email_body, preprocessed, active_base_prompt,
+                                        request, deadline, background_tasks)
+
     tone_details = db.get_tone_by_keyword(email_request.tone)
-    tone_instructions_segment = "" # Use a different variable name to avoid conflict with a potential 'tone_instructions' in tone_details
-    if tone_details and tone_details.get('instructions'):
-        tone_instructions_segment = f"Apply the following tone guidance for '{tone_details.get('label', email_request.tone)}':\n{tone_details['instructions']}\n\n"
-    else:
+    if not tone_details or not tone_details.get('instructions'):
         # Optional: log if specific tone instructions are not found
         print(f"INFO: No specific instructions found for tone '{email_request.tone}', using base prompt and general instructions.")
         # Even if no specific instructions, we still want the tone to be part of the general instruction.
 
-    # Reconstruct the detailed multi-step prompt using fetched components
-    prompt = f"""{active_base_prompt}
-
-{tone_instructions_segment}The user has submitted the following email and would like it rewritten in a "{email_request.tone}" tone. The original email is:
-
---- ORIGINAL EMAIL ---
-{email_request.email}
-----------------------
-
-Please complete the following tasks:
-
-1. Briefly analyze the tone and effectiveness of the original email (1–2 sentences) against the desired "{email_request.tone}" tone. This analysis should help the user understand areas for improvement in their original draft when aiming for this specific tone.
-2. Suggest a concise and fitting subject line for the rewritten email that reflects the "{email_request.tone}" tone.
-3. Rewrite the email in the specified "{email_request.tone}" tone, ensuring the core message and intent of the original email are preserved.
-
-Respond using the following exact format, including the labels ANALYSIS:, SUBJECT:, and REWRITTEN EMAIL: (do not add any other text or markdown like ```json or ```):
+    # Look for a near-duplicate email rewritten with the same tone and prompt version
+    version = prompt_version(active_base_prompt, tone_details.get('instructions') if tone_details else None)
+    similar_entry, similarity, signature = None, 0.0, None
+    if email_request.reuse_similar:
+        with span("similarity_lookup"):
+            signature = await run_in_threadpool(similarity_index.signature, email_body)
+            similar_entry, similarity = similarity_index.find_similar(
+                email_body, email_request.tone, version, SIMILARITY_THRESHOLD, signature=signature
+            )
 
-ANALYSIS:
-[Your analysis here]
+    # A match with different numbers, dates or names can't be handed back as is (it would carry
+    # the other email's details), so it is only used as a draft.
+    reuse_mode = email_request.reuse_similar
+    if similar_entry and reuse_mode == "return" and not details_match(email_body, similar_entry["original_email"]):
+        reuse_mode = "draft"
 
-SUBJECT:
-[Your subject line here]
+    if similar_entry and reuse_mode == "return":
+        log_rewrite(reused_log_entry(email_request.email, email_request.tone, similar_entry, similarity, preprocessed))
+        result = {
+            "original": email_request.email,
+            "rewritten": with_stripped_parts(similar_entry["rewritten"], preprocessed),
+            "tone": email_request.tone,
+            "reused": {"similarity": round(similarity, 3), "matched_timestamp": similar_entry["timestamp"]}
+        }
+        if preprocessed:
+            result["preprocessing"] = preprocessed.stats()
+        return result
 
-REWRITTEN EMAIL:
-[Your rewritten email here]
-    """
-    # Ensure this `prompt` variable is the one used in `model.generate_content(prompt)`
+    # Reconstruct the detailed multi-step prompt using fetched components
+    with span("prompt_build"):
+        prompt = build_rewrite_prompt(
+            active_base_prompt, email_request.tone, tone_details, email_body,
+            draft=similar_entry["rewritten"] if similar_entry else None
+        )
+    # Ensure this `prompt` variable is the one used in `generate_with_deadline(prompt, ...)`
     # and logged in `log_entry["final_prompt"] = prompt`.
 
     try:
-        response = model.generate_content(prompt)
-        rewritten_email = response.text.strip()
+        rewritten_email = (await generate_with_deadline(prompt, request, deadline, rewrite_priority(request))).strip()
 
         log_entry = {
             "timestamp": datetime.utcnow().isoformat(),
@@ -157,18 +286,166 @@ REWRITTEN EMAIL:
             "user_feedback": None
         }
 
+        if similar_entry:
+            log_entry["draft_similarity"] = round(similarity, 3)
+        if preprocessed:
+            log_entry["preprocessing"] = preprocessed.stats()
+
         log_rewrite(log_entry)
+        background_tasks.add_task(index_rewrites, email_body, [(email_request.tone, version, rewritten_email)], signature)
 
-        return {
+        result = {
             "original": email_request.email,
-            "rewritten": rewritten_email,
+            "rewritten": with_stripped_parts(rewritten_email, preprocessed),
             "tone": email_request.tone
         }
+        if preprocessed:
+            result["preprocessing"] = preprocessed.stats()
+        if similar_entry:
+            result["draft_from"] = {"similarity": round(similarity, 3), "matched_timestamp": similar_entry["timestamp"],
+                                    "details_differ": email_request.reuse_similar == "return"}
+        return result
+    except (ClientDisconnected, DeadlineExceeded) as e:
+        record_rewrite_failure([email_request.tone], e)
+        return deadline_error_response(e, "/rewrite")
+    except Overloaded as e:
+        record_rewrite_failure([email_request.tone], e)
+        return overloaded_response(e)
     except Exception as e:
+        record_rewrite_failure([email_request.tone], e)
         return {
             "error": f"Failed to generate email: {str(e)}"
         }
 
+def with_stripped_parts(rewritten: str, preprocessed) -> str:
+    # Re-attach the signature, disclaimer and quoted thread removed before prompting
+    return reattach(rewritten, preprocessed) if preprocessed else rewritten
+
+def reused_log_entry(email, tone, similar_entry, similarity, preprocessed=None):
+    entry = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "original_email": email,
+        "tone": tone,
+        "final_prompt": None,
+        "gemini_response": similar_entry["rewritten"],
+        "user_feedback": None,
+        "reused_similarity": round(similarity, 3)
+    }
+    if preprocessed:
+        entry["preprocessing"] = preprocessed.stats()
+    return entry
+
+async def rewrite_multi_tone(email_request: EmailRequest, email_body: str, preprocessed, active_base_prompt: str,
+                             request: Request, deadline: float, background_tasks: BackgroundTasks):
+    """
+    Rewrites one email in several tones with a single Gemini call.
+    Each tone is logged as its own history entry so /history and /analyse_prompt see them individually.
+    """
+    tones = list(dict.fromkeys(email_request.tones))  # de-duplicate, keep order
+    results = {}
+    pending = []  # (keyword, tone_details, version) still needing the LLM
+    drafts = {}   # keyword -> (similar_entry, similarity) offered to the LLM as a starting draft
+    signature = None
+    if email_request.reuse_similar:
+        # One signature for the email, shared by every tone's lookup and index entry
+        with span("similarity_signature"):
+            signature = await run_in_threadpool(similarity_index.signature, email_body)
+    for keyword in tones:
+        tone_details = db.get_tone_by_keyword(keyword)
+        version = prompt_version(active_base_prompt, tone_details.get('instructions') if tone_details else None)
+        if email_request.reuse_similar:
+            with span("similarity_lookup", tone=keyword):
+                similar_entry, similarity = similarity_index.find_similar(
+                    email_body, keyword, version, SIMILARITY_THRESHOLD, signature=signature
+                )
+            # As for single-tone requests, a match with different details is only used as a draft
+            if (similar_entry and email_request.reuse_similar == "return"
+                    and details_match(email_body, similar_entry["original_email"])):
+                log_rewrite(reused_log_entry(email_request.email, keyword, similar_entry, similarity, preprocessed))
+                rewritten = with_stripped_parts(similar_entry["rewritten"], preprocessed)
+                results[keyword] = {
+                    "tone": keyword,
+                    "rewritten": rewritten,
+                    **parse_rewrite_response(rewritten),
+                    "reused": {"similarity": round(similarity, 3), "matched_timestamp": similar_entry["timestamp"]}
+                }
+                continue
+            if similar_entry:
+                drafts[keyword] = (similar_entry, similarity)
+        pending.append((keyword, tone_details, version))
+
+    if pending:
+        with span("prompt_build", tones=len(pending)):
+            prompt = build_multi_tone_prompt(
+                active_base_prompt, [(keyword, details) for keyword, details, _ in pending], email_body,
+                drafts={keyword: entry["rewritten"] for keyword, (entry, _) in drafts.items()}
+            )
+        try:
+            response_text = await generate_with_deadline(prompt, request, deadline, rewrite_priority(request))
+            sections = split_multi_tone_response(response_text, [keyword for keyword, _, _ in pending])
+        except (ClientDisconnected, DeadlineExceeded) as e:
+            record_rewrite_failure([keyword for keyword, _, _ in pending], e)
+            return deadline_error_response(e, "/rewrite")
+        except Overloaded as e:
+            record_rewrite_failure([keyword for keyword, _, _ in pending], e)
+            return overloaded_response(e)
+        except Exception as e:
+            record_rewrite_failure([keyword for keyword, _, _ in pending], e)
+            return {
+                "error": f"Failed to generate email: {str(e)}"
+            }
+
+        timestamp = datetime.utcnow().isoformat()
+        indexed = []
+        for keyword, _, version in pending:
+            section = sections.get(keyword)
+            if not section:
+                history_stats.record_failure(keyword, "error")
+                results[keyword] = {"tone": keyword, "error": f"No rewrite returned for tone '{keyword}'."}
+                continue
+            log_entry = {
+                "timestamp": timestamp,
+                "original_email": email_request.email,
+                "tone": keyword,
+                "final_prompt": prompt,
+                "gemini_response": section,
+                "user_feedback": None,
+                "multi_tone_batch": tones
+            }
+            if keyword in drafts:
+                log_entry["draft_similarity"] = round(drafts[keyword][1], 3)
+            if preprocessed:
+                log_entry["preprocessing"] = preprocessed.stats()
+            log_rewrite(log_entry)
+            indexed.append((keyword, version, section))
+            rewritten = with_stripped_parts(section, preprocessed)
+            results[keyword] = {"tone": keyword, "rewritten": rewritten, **parse_rewrite_response(rewritten)}
+            if keyword in drafts:
+                draft_entry, similarity = drafts[keyword]
+                results[keyword]["draft_from"] = {"similarity": round(similarity, 3), "matched_timestamp": draft_entry["timestamp"],
+                                                  "details_differ": email_request.reuse_similar == "return"}
+        if indexed:
+            background_tasks.add_task(index_rewrites, email_body, indexed, signature)
+
+    response = {
+        "original": email_request.email,
+        "tones": tones,
+        "results": [results[keyword] for keyword in tones]
+    }
+    if preprocessed:
+        response["preprocessing"] = preprocessed.stats()
+    return response
+
+@app.get("/history/stats")
+async def get_history_stats(days: Optional[int] = None):
+    """
+    Usage aggregates: rewrites, average input/output length and failure rates per tone and per day.
+    Served from incrementally maintained counters, so the cost doesn't grow with the history.
+    """
+    if days is not None and days < 1:
+        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"error": "days must be at least 1."})
+    return history_stats.summary(days=days)
+
 @app.get("/history")
 async def get_history():
     """
@@ -181,7 +458,8 @@ async def get_history():
         return []
 
     try:
-        history_content = LOG_PATH.read_text(encoding="utf-8")
+        with span("log_read", path=str(LOG_PATH)):
+            history_content = LOG_PATH.read_text(encoding="utf-8")
         if not history_content.strip():
             # If the file exists but is empty (or contains only whitespace),
             # return an empty list or an appropriate message.
@@ -209,8 +487,37 @@ async def get_history():
 # class AnalysisTriggerRequest(BaseModel):
 #     trigger: bool = True
 
+ANALYSIS_REPAIR_MODEL = os.getenv("ANALYSIS_REPAIR_MODEL", "gpt-3.5-turbo")
+
+async def repair_analysis_fragment(fragment, missing, request, deadline):
+    """
+    Asks a cheap model to fix the JSON syntax of only the broken part of the analysis output.
+    Returns the repaired fields, or {} if the repair failed (the partial result is still returned).
+    """
+    try:
+        async with scheduler.slot(ANALYSIS, timeout=max(0.0, deadline - time.monotonic())):
+            with span("provider", provider="openai", purpose="analysis_repair", prompt_chars=len(fragment)):
+                response = await run_with_deadline(
+                    provider_clients.chat_completion(
+                        model=ANALYSIS_REPAIR_MODEL,
+                        messages=[{"role": "user", "content": build_fragment_repair_prompt(fragment, missing)}],
+                        temperature=0,
+                        request_timeout=(PROVIDER_CONNECT_TIMEOUT, provider_timeout(deadline))
+                    ),
+                    request, deadline
+                )
+    except ClientDisconnected:
+        raise
+    except Exception as e:
+        print(f"WARNING: Could not repair analysis fields {missing}: {e}")
+        return {}
+
+    repaired, _ = parse_analysis(response.choices[0].message.content.strip())
+    return {field: repaired[field] for field in missing if repaired and field in repaired}
+
 @app.post("/analyse_prompt")
-async def analyse_prompt(): # Removed req: PromptAnalysisRequest
+async def analyse_prompt(request: Request): # Removed req: PromptAnalysisRequest
+    deadline = resolve_deadline(request, ANALYSIS_DEADLINE_SECONDS)
     try:
         active_base_prompt = db.get_active_base_prompt()
         if not active_base_prompt:
@@ -228,7 +535,8 @@ async def analyse_prompt(): # Removed req: PromptAnalysisRequest
                 content={"error": "rewrite_history.json not found."}
             )
 
-        history_content = LOG_PATH.read_text(encoding="utf-8")
+        with span("log_read", path=str(LOG_PATH)):
+            history_content = LOG_PATH.read_text(encoding="utf-8")
         if not history_content:
             return JSONResponse(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -283,6 +591,7 @@ async def analyse_prompt(): # Removed req: PromptAnalysisRequest
                 examples_by_tone_str += "No examples found for this tone.\n"
 
         # Construct the prompt for GPT-4 (Steps 4 & 5 from plan)
+        prompt_build_started = time.perf_counter()
         gpt4_prompt = f"""The current active base prompt is:
 --- BEGIN ACTIVE BASE PROMPT ---
 {active_base_prompt}
@@ -349,27 +658,56 @@ Return your response as **valid JSON** with these exact top-level keys and struc
 - Do not include any markdown formatting (like ```json), comments, or surrounding text outside the main JSON object.
 - For `improvement_suggestions`, provide at least one suggestion, even if it's minor.
 """
+        profiling.record_span("prompt_build", prompt_build_started, prompt_chars=len(gpt4_prompt))
 
         # Send this prompt to GPT-4 (Step 6 from plan)
-        response = openai.ChatCompletion.create(
-            model="gpt-4", # Or "gpt-4-turbo" or other preferred model
-            messages=[
-                {"role": "system", "content": "You are an expert prompt engineer and AI writing assistant."},
-                {"role": "user", "content": gpt4_prompt}
-            ],
-            temperature=0.7 # Adjust as needed
-        )
+        async with scheduler.slot(ANALYSIS, timeout=max(0.0, deadline - time.monotonic())):
+            with span("provider", provider="openai", prompt_chars=len(gpt4_prompt)):
+                response = await run_with_deadline(
+                    provider_clients.chat_completion(
+                        model="gpt-4", # Or "gpt-4-turbo" or other preferred model
+                        messages=[
+                            {"role": "system", "content": "You are an expert prompt engineer and AI writing assistant."},
+                            {"role": "user", "content": gpt4_prompt}
+                        ],
+                        temperature=0.7, # Adjust as needed
+                        request_timeout=(PROVIDER_CONNECT_TIMEOUT, provider_timeout(deadline))
+                    ),
+                    request, deadline
+                )
 
-        # Return the raw text output from GPT-4 (Step 7 from plan)
-         # Parse the JSON response from GPT-4
+        # Parse the JSON response from GPT-4, repairing and salvaging what we can
         gpt_response = response.choices[0].message.content.strip()
-        
-        # Parse the JSON string into a Python object
-        analysis_result = json.loads(gpt_response)
-        
-        # Return the parsed object directly (Flask will JSON-encode it)
+        analysis_result, parse_status = parse_analysis(gpt_response)
+
+        # Only complete-but-malformed fields are sent for a syntax fix; cut-off fields stay missing
+        parse_status["repaired_fields"] = []
+        repairable = repairable_fields(parse_status)
+        if repairable:
+            fragment = broken_fragment(gpt_response, repairable, cut_off=parse_status["cut_off"])
+            if fragment:
+                repaired = await repair_analysis_fragment(fragment, repairable, request, deadline)
+                if repaired:
+                    analysis_result = {**(analysis_result or {}), **repaired}
+                    parse_status["missing"] = [f for f in parse_status["missing"] if f not in repaired]
+                    parse_status["partial"] = bool(parse_status["missing"])
+                    parse_status["repaired_fields"] = list(repaired)
+                    parse_status["issues"].append(f"Fixed the syntax of {', '.join(repaired)} with a follow-up call")
+
+        if parse_status["issues"]:
+            print(f"WARNING: /analyse_prompt output needed repair: {'; '.join(parse_status['issues'])}")
+
+        if analysis_result is None:
+            # Nothing salvageable; hand back the raw text rather than failing the whole analysis
+            return {"output": gpt_response, "parse_status": parse_status}
+
+        analysis_result["parse_status"] = parse_status
         return analysis_result
 
+    except (ClientDisconnected, DeadlineExceeded) as e:
+        return deadline_error_response(e, "/analyse_prompt")
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         # Log the exception for server-side debugging
         print(f"ERROR in /analyse_prompt: {str(e)}")
@@ -378,6 +716,32 @@ Return your response as **valid JSON** with these exact top-level keys and struc
             content={"error": f"An unexpected error occurred during prompt analysis: {str(e)}"}
         )
 
+# --- Admin: stored request profiles ---
+
+def admin_forbidden_response():
+    return JSONResponse(status_code=status.HTTP_403_FORBIDDEN, content={"error": "Admin token required."})
+
+@app.get("/admin/profiles")
+async def list_profiles_endpoint(request: Request):
+    if not profiling.is_admin(request):
+        return admin_forbidden_response()
+    return profiling.store.list()
+
+@app.get("/admin/profiles/{profile_id}")
+async def get_profile_endpoint(profile_id: str, request: Request, format: str = "json"):
+    """
+    Returns a stored profile. format=json gives the span timeline and top functions;
+    format=prof downloads the raw cProfile data for pstats/snakeviz.
+    """
+    if not profiling.is_admin(request):
+        return admin_forbidden_response()
+    path = profiling.store.path_for(profile_id, format)
+    if path is None:
+        return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"error": f"Profile '{profile_id}' ({format}) not found."})
+    if format == "prof":
+        return FileResponse(path, media_type="application/octet-stream", filename=path.name)
+    return JSONResponse(content=json.loads(path.read_text(encoding="utf-8")))
+
 # --- Prompt Management Endpoints ---
 
 @app.get("/prompts/base")
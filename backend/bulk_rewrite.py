@@ -0,0 +1,317 @@
+# File: backend/bulk_rewrite.py
+# Offline bulk rewrite of email template libraries (CSV, JSONL or mbox).
+#
+# Usage (from the backend directory):
+#   python bulk_rewrite.py templates.csv -o rewritten.jsonl --workers 4 --rate 60
+#
+# Records are streamed from the input file, rewritten by a pool of worker threads under a
+# shared rate limit, and appended to the output JSONL file as they complete. A checkpoint file
+# records which records are done, so re-running the same command after an interruption
+# resumes exactly where it stopped.
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email import policy
+from email.parser import BytesParser
+from pathlib import Path
+
+from dotenv import load_dotenv
+import google.generativeai as genai
+
+# Load env vars before importing local modules, which read their settings at import time
+load_dotenv()
+
+from database.prompt_db import PromptDatabase
+from deadlines import PROVIDER_READ_TIMEOUT
+from email_preprocess import preprocess_email, reattach
+from prompt_builder import FALLBACK_BASE_PROMPT, build_rewrite_prompt, parse_rewrite_response
+
+
+# --- Streaming readers. Each yields (index, record) where record has 'id', 'email' and 'tone'. ---
+# A record that can't be parsed is yielded with an 'error' instead, so it is reported (once) as
+# an invalid record rather than stopping the run.
+
+def read_csv(path, email_field, tone_field, id_field):
+    with open(path, newline="", encoding="utf-8") as f:
+        for index, row in enumerate(csv.DictReader(f)):
+            yield index, {"id": row.get(id_field), "email": row.get(email_field) or "", "tone": row.get(tone_field)}
+
+
+def read_jsonl(path, email_field, tone_field, id_field):
+    with open(path, encoding="utf-8") as f:
+        index = 0
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+                if not isinstance(row, dict):
+                    raise ValueError(f"expected a JSON object, got {type(row).__name__}")
+            except ValueError as e:
+                yield index, {"id": None, "email": "", "tone": None, "error": f"Malformed JSONL record: {e}"}
+            else:
+                yield index, {"id": row.get(id_field), "email": row.get(email_field) or "", "tone": row.get(tone_field)}
+            index += 1
+
+
+def _mbox_message_to_record(raw_lines):
+    # Undo mboxrd "From " quoting before parsing
+    raw = b"".join(line[1:] if line.startswith(b">") and line.lstrip(b">").startswith(b"From ") else line
+                   for line in raw_lines)
+    message = BytesParser(policy=policy.default).parsebytes(raw)
+    try:
+        body = message.get_body(preferencelist=("plain",))
+        text = body.get_content() if body is not None else ""
+    except Exception as e:  # malformed MIME structure, unknown charset, ...
+        return {"id": message.get("Message-ID"), "email": "", "tone": None, "error": f"Malformed mbox message: {e}"}
+    return {"id": message.get("Message-ID"), "email": text.strip(), "tone": message.get("X-Rewrite-Tone")}
+
+
+def read_mbox(path, email_field=None, tone_field=None, id_field=None):
+    # Messages are split on the "From " separator line, one at a time, so the whole mailbox is never in memory.
+    with open(path, "rb") as f:
+        index = 0
+        current = None
+        for line in f:
+            if line.startswith(b"From "):
+                if current is not None:
+                    yield index, _mbox_message_to_record(current)
+                    index += 1
+                current = []
+            elif current is not None:
+                current.append(line)
+        if current is not None:
+            yield index, _mbox_message_to_record(current)
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl, "mbox": read_mbox}
+
+
+# --- Rate limiting and checkpoints ---
+
+class RateLimiter:
+    """Spaces calls evenly so no more than `per_minute` start in any minute, across all worker threads."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Checkpoint:
+    """
+    Tracks completed record indices as a contiguous watermark plus the set of
+    out-of-order completions above it, written atomically at most every `save_interval`
+    seconds (and on exit). Anything finished since the last save is recovered from the
+    output file on resume (see completed_in_output).
+    """
+
+    def __init__(self, path, input_path, save_interval=1.0):
+        self.path = Path(path)
+        self.input_path = str(input_path)
+        self.watermark = 0  # every index below this is done
+        self.done = set()
+        self.save_interval = save_interval
+        self._saved_at = 0.0
+        if self.path.exists():
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if data.get("input") != self.input_path:
+                raise ValueError(f"Checkpoint {self.path} belongs to a different input ({data.get('input')}).")
+            self.watermark = data.get("watermark", 0)
+            self.done = set(data.get("done", []))
+
+    def is_done(self, index):
+        return index < self.watermark or index in self.done
+
+    def mark_done(self, index):
+        self.done.add(index)
+        while self.watermark in self.done:
+            self.done.remove(self.watermark)
+            self.watermark += 1
+        if time.monotonic() - self._saved_at >= self.save_interval:
+            self.save()
+
+    def save(self):
+        self._saved_at = time.monotonic()
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"input": self.input_path, "watermark": self.watermark, "done": sorted(self.done)}, f)
+        os.replace(tmp_path, self.path)
+
+
+# --- Rewriting ---
+
+class BulkRewriter:
+    def __init__(self, db, model, default_tone, rate_limiter, retries=2, preprocess=True):
+        self.model = model
+        self.preprocess = preprocess
+        self.default_tone = default_tone
+        self.rate_limiter = rate_limiter
+        self.retries = retries
+        # Prompt components are read once so every record in a run uses the same prompt version.
+        self.base_prompt = db.get_active_base_prompt() or FALLBACK_BASE_PROMPT
+        self.tones = {tone["keyword"]: tone for tone in db.get_active_tones()}
+
+    def rewrite(self, index, record):
+        tone = record.get("tone") or self.default_tone
+        result = {"index": index, "id": record.get("id"), "tone": tone, "original_email": record["email"]}
+        # Input errors can never succeed, so they are checkpointed like successes; only provider
+        # failures are left to be retried on the next run.
+        if record.get("error"):
+            result.update(error=record["error"], error_type="input")
+            return result
+        if not record["email"].strip():
+            result.update(error="Empty email", error_type="input")
+            return result
+
+        preprocessed = preprocess_email(record["email"]) if self.preprocess else None
+        if preprocessed:
+            result["preprocessing"] = preprocessed.stats()
+        email_body = preprocessed.body if preprocessed else record["email"]
+
+        prompt = build_rewrite_prompt(self.base_prompt, tone, self.tones.get(tone), email_body)
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(2 ** attempt)
+            self.rate_limiter.wait()
+            try:
+                response = self.model.generate_content(prompt, request_options={"timeout": PROVIDER_READ_TIMEOUT})
+                text = response.text.strip()
+                result.update(parse_rewrite_response(reattach(text, preprocessed) if preprocessed else text))
+                result["raw_response"] = text
+                return result
+            except Exception as e:
+                last_error = e
+        result.update(error=f"Failed to generate email: {last_error}", error_type="provider")
+        return result
+
+
+def completed_in_output(output_path):
+    """Indices already finished in the output (rewritten or invalid), in case the checkpoint lagged behind."""
+    indices = set()
+    if not output_path.exists():
+        return indices
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # partially written last line from an interrupted run
+            if not row.get("error") or row.get("error_type") == "input":
+                indices.add(row["index"])
+    return indices
+
+
+def run(args):
+    input_path = Path(args.input)
+    output_path = Path(args.output)
+    fmt = args.format or input_path.suffix.lstrip(".").lower()
+    if fmt not in READERS:
+        raise SystemExit(f"Unsupported input format '{fmt}'. Use --format csv, jsonl or mbox.")
+
+    checkpoint = Checkpoint(args.checkpoint or f"{output_path}.checkpoint.json", input_path.resolve())
+    for index in completed_in_output(output_path):
+        if not checkpoint.is_done(index):
+            checkpoint.mark_done(index)
+
+    gemini_api_key = os.getenv("GEMINI_API_KEY")
+    if not gemini_api_key:
+        raise ValueError("GEMINI_API_KEY not found in environment variables")
+    genai.configure(api_key=gemini_api_key)
+    model = genai.GenerativeModel(args.model)
+
+    db_path = Path(__file__).parent / "database" / "prompts.db"
+    rewriter = BulkRewriter(PromptDatabase(db_path=str(db_path)), model, args.tone,
+                            RateLimiter(args.rate), retries=args.retries, preprocess=not args.no_preprocess)
+
+    records = READERS[fmt](input_path, args.email_field, args.tone_field, args.id_field)
+    max_in_flight = args.workers * 2
+    counts = {"written": 0, "invalid": 0, "failed": 0}
+    skipped = 0
+
+    pool = ThreadPoolExecutor(max_workers=args.workers)
+    with open(output_path, "a", encoding="utf-8") as out:
+        in_flight = set()
+        try:
+            for index, record in records:
+                if checkpoint.is_done(index):
+                    skipped += 1
+                    continue
+                in_flight.add(pool.submit(rewriter.rewrite, index, record))
+                if len(in_flight) >= max_in_flight:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        counts[write_result(out, checkpoint, future.result())] += 1
+
+            while in_flight:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    counts[write_result(out, checkpoint, future.result())] += 1
+        except KeyboardInterrupt:
+            # Don't wait for running workers (with retries and read timeouts that can take minutes).
+            # Every result is already on disk; records in flight are redone on resume.
+            pool.shutdown(wait=False, cancel_futures=True)
+            checkpoint.save()
+            print(f"\nInterrupted. {counts['written']} written this run; re-run the same command to resume.", file=sys.stderr)
+            sys.stdout.flush()
+            sys.stderr.flush()
+            # SystemExit would still join the running worker threads at interpreter exit.
+            os._exit(130)
+    pool.shutdown()
+    checkpoint.save()
+
+    print(f"Done. {counts['written']} rewritten, {counts['invalid']} invalid, {counts['failed']} failed, "
+          f"{skipped} already completed in a previous run.")
+    if counts["failed"]:
+        print("Failed records are not checkpointed and will be retried on the next run.")
+
+
+def write_result(out, checkpoint, result):
+    out.write(json.dumps(result, ensure_ascii=False) + "\n")
+    out.flush()
+    os.fsync(out.fileno())
+    if result.get("error"):
+        print(f"ERROR: record {result['index']} ({result.get('id')}): {result['error']}", file=sys.stderr)
+        if result.get("error_type") != "input":
+            return "failed"
+    checkpoint.mark_done(result["index"])
+    return "invalid" if result.get("error") else "written"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Rewrite a library of emails from a CSV, JSONL or mbox file.")
+    parser.add_argument("input", help="Input file (.csv, .jsonl or .mbox)")
+    parser.add_argument("-o", "--output", required=True, help="Output JSONL file (appended to)")
+    parser.add_argument("--format", choices=sorted(READERS), help="Input format (default: from the file extension)")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <output>.checkpoint.json)")
+    parser.add_argument("--workers", type=int, default=4, help="Number of concurrent workers (default: 4)")
+    parser.add_argument("--rate", type=float, default=60, help="Max requests per minute across all workers, 0 for no limit (default: 60)")
+    parser.add_argument("--retries", type=int, default=2, help="Retries per record on provider errors (default: 2)")
+    parser.add_argument("--tone", default="professional", help="Tone for records that don't specify one (default: professional)")
+    parser.add_argument("--no-preprocess", action="store_true", help="Send emails as-is instead of stripping quoted threads, signatures and disclaimers")
+    parser.add_argument("--model", default="models/gemini-2.0-flash", help="Gemini model name")
+    parser.add_argument("--email-field", default="email", help="CSV column / JSON key holding the email body")
+    parser.add_argument("--tone-field", default="tone", help="CSV column / JSON key holding the tone")
+    parser.add_argument("--id-field", default="id", help="CSV column / JSON key holding the record id")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    run(parse_args())
@@ -0,0 +1,95 @@
+"""
+Checks that provider calls reuse pooled keep-alive connections.
+
+Starts a local HTTP stand-in for the OpenAI API that counts the TCP connections it
+accepts, points openai at it, and makes several calls through provider_clients.
+With pooling, sequential calls should all share a single connection.
+
+Run from the backend directory:
+    python check_connection_reuse.py
+"""
+import asyncio
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openai
+
+import provider_clients
+
+CALLS = 10
+
+FAKE_COMPLETION = json.dumps({
+    "id": "chatcmpl-local",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "{}"}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+}).encode("utf-8")
+
+
+class CountingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    connections = 0
+    requests = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with CountingHandler.lock:
+            CountingHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with CountingHandler.lock:
+            CountingHandler.requests += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(FAKE_COMPLETION)))
+        self.end_headers()
+        self.wfile.write(FAKE_COMPLETION)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def reset_counts():
+    CountingHandler.connections = 0
+    CountingHandler.requests = 0
+
+
+async def run_async_calls():
+    await provider_clients.startup()
+    for _ in range(CALLS):
+        await provider_clients.chat_completion(model="gpt-4", messages=[{"role": "user", "content": "ping"}])
+    await provider_clients.shutdown()
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CountingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    openai.api_key = "local-test-key"
+    openai.api_base = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    print("🔌 Local stand-in listening at", openai.api_base)
+
+    ok = True
+
+    for _ in range(CALLS):
+        openai.ChatCompletion.create(model="gpt-4", messages=[{"role": "user", "content": "ping"}])
+    print(f"sync (requests):  {CountingHandler.requests} requests over {CountingHandler.connections} connection(s)")
+    ok &= CountingHandler.requests == CALLS and CountingHandler.connections == 1
+
+    reset_counts()
+    asyncio.run(run_async_calls())
+    print(f"async (aiohttp): {CountingHandler.requests} requests over {CountingHandler.connections} connection(s)")
+    ok &= CountingHandler.requests == CALLS and CountingHandler.connections == 1
+
+    server.shutdown()
+    print("✅ Connections are reused" if ok else "❌ Expected every call to reuse one connection")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
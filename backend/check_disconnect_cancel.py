@@ -0,0 +1,122 @@
+"""
+Checks that a provider call is cancelled when the client disconnects mid-request.
+
+Starts the app under uvicorn with the Gemini model replaced by a slow local stand-in, sends
+a /rewrite request over a raw socket and closes the socket while the call is running. The
+stand-in call should be cancelled promptly and nothing should be logged. It runs once as a
+plain request and once with every request profiled, since middleware that wraps `receive`
+(like BaseHTTPMiddleware) hides the disconnect from the endpoint.
+
+Run from the backend directory:
+    python check_disconnect_cancel.py
+"""
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# No provider is called; placeholders let the app start without real keys.
+os.environ.setdefault("GEMINI_API_KEY", "local-test-key")
+os.environ.setdefault("OPENAI_API_KEY", "local-test-key")
+
+import uvicorn
+
+import app_fastapi
+import profiling
+from deadlines import DISCONNECT_POLL_SECONDS
+from history_stats import HistoryStats
+from similarity_index import SimilarityIndex
+
+STAND_IN_SECONDS = 5
+CLOSE_AFTER_SECONDS = 0.5
+MAX_CANCEL_DELAY = DISCONNECT_POLL_SECONDS + 0.5
+
+EMAIL = {"email": "Hi Bob,\n\nCan you send the Q3 report by Friday?\n\nJane", "tone": "friendly"}
+
+
+class SlowModel:
+    """Stands in for the Gemini model: a slow call that records whether it was cancelled."""
+
+    def __init__(self):
+        self.started_at = self.cancelled_at = None
+        self.completed = False
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.started_at = time.monotonic()
+        try:
+            await asyncio.sleep(STAND_IN_SECONDS)
+        except asyncio.CancelledError:
+            self.cancelled_at = time.monotonic()
+            raise
+        self.completed = True
+        return type("Response", (), {"text": "ANALYSIS:\nok\n\nSUBJECT:\nok\n\nREWRITTEN EMAIL:\nok"})()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def disconnect_mid_request(port, model):
+    """Sends /rewrite, closes the socket while the provider call runs. Returns the cancel delay or None."""
+    body = json.dumps(EMAIL).encode("utf-8")
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.sendall(
+        b"POST /rewrite HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+        + f"Content-Length: {len(body)}\r\n\r\n".encode("ascii") + body
+    )
+    time.sleep(CLOSE_AFTER_SECONDS)
+    if model.started_at is None:
+        sock.close()
+        print("   the provider call never started")
+        return None
+    closed_at = time.monotonic()
+    sock.close()
+
+    give_up_at = closed_at + STAND_IN_SECONDS + 1
+    while model.cancelled_at is None and not model.completed and time.monotonic() < give_up_at:
+        time.sleep(0.01)
+    return model.cancelled_at - closed_at if model.cancelled_at is not None else None
+
+
+def main():
+    scratch = Path(tempfile.mkdtemp(prefix="disconnect-check-"))
+    app_fastapi.LOG_PATH = scratch / "rewrite_history.json"
+    app_fastapi.history_stats = HistoryStats(scratch / "rewrite_stats.json")
+    app_fastapi.similarity_index = SimilarityIndex(scratch / "similarity_index.jsonl")
+    profiling.store.directory = scratch / "profiles"
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app_fastapi.app, host="127.0.0.1", port=port, log_level="warning"))
+    server.install_signal_handlers = lambda: None  # not on the main thread
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    print("🔌 App listening at", f"http://127.0.0.1:{port}")
+
+    ok = True
+    for label, sample_rate in (("plain request", 0.0), ("profiled request", 1.0)):
+        profiling.PROFILE_SAMPLE_RATE = sample_rate
+        model = app_fastapi.model = SlowModel()
+        delay = disconnect_mid_request(port, model)
+        logged = app_fastapi.LOG_PATH.exists()
+        passed = delay is not None and delay <= MAX_CANCEL_DELAY and not logged
+        ok &= passed
+        outcome = f"cancelled {delay:.2f}s after the close" if delay is not None else "not cancelled"
+        print(f"{'✅' if passed else '❌'} {label}: {outcome}{', history entry written' if logged else ''}")
+
+    server.should_exit = True
+    thread.join(timeout=5)
+    print("✅ Disconnects cancel provider calls" if ok else "❌ Expected the provider call to be cancelled on disconnect")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Checks email preprocessing against known false positives and expected strips.
+
+Ordinary body text (a sentence starting "If you are not...", a "--" separator in the
+middle of the email) must never be cut off as a disclaimer or signature, while real
+signatures, disclaimers and quoted threads must still be stripped.
+
+Run from the backend directory:
+    python check_email_preprocess.py
+"""
+import sys
+
+from email_preprocess import preprocess_email
+
+LONG_AGENDA = (
+    "Hi,\n\nAgenda:\n--\n1. Budget review\n2. Hiring plan for the platform team\n3. AOB\n\n"
+    "Please come prepared with your numbers.\nWe will also cover the offsite, the roadmap,\n"
+    "the support rota, the new expense tool,\nthe office move and the holiday calendar.\n"
+    "Bring questions for the Q&A at the end.\nSlides will be shared afterwards.\n\nThanks,\nJane"
+)
+
+# (name, email, expected body, expected stripped parts)
+CASES = [
+    (
+        "body sentence starting 'If you are not'",
+        "Hi team,\n\nThe meeting is at 3pm.\n\nIf you are not able to attend, please send a delegate.\n\nThanks,\nJane",
+        "Hi team,\n\nThe meeting is at 3pm.\n\nIf you are not able to attend, please send a delegate.\n\nThanks,\nJane",
+        [],
+    ),
+    (
+        "body sentence 'This message is intended'",
+        "Hi Bob,\n\nThis message is intended to clarify the new leave policy.\n\nBest,\nAlice",
+        "Hi Bob,\n\nThis message is intended to clarify the new leave policy.\n\nBest,\nAlice",
+        [],
+    ),
+    (
+        "'--' separator in the body",
+        LONG_AGENDA,
+        LONG_AGENDA,
+        [],
+    ),
+    (
+        "'Thanks!' followed by the actual request",
+        "Hi Bob,\n\nThanks!\n\nCan you send the Q3 report by Friday?\n\nJane",
+        "Hi Bob,\n\nThanks!\n\nCan you send the Q3 report by Friday?\n\nJane",
+        [],
+    ),
+    (
+        "'Thank you.' followed by body lines with legal words",
+        "Hi Sam,\n\nThank you.\nThe contract is confidential, please delete this draft after reading.\nLet me know.\n\nAlex",
+        "Hi Sam,\n\nThank you.\nThe contract is confidential, please delete this draft after reading.\nLet me know.\n\nAlex",
+        [],
+    ),
+    (
+        "contact block under the sign-off",
+        "Hi,\n\nPlease see attached.\n\nKind regards,\nJane Doe\nHead of Operations\n+44 20 1234 5678",
+        "Hi,\n\nPlease see attached.\n\nKind regards,\nJane Doe",
+        ["signature"],
+    ),
+    (
+        "disclaimer with a strong marker after the sign-off",
+        "Hi,\n\nPlease see attached.\n\nKind regards,\nJane\n\n"
+        "CONFIDENTIALITY NOTICE: The contents of this email are for the named recipient only.",
+        "Hi,\n\nPlease see attached.\n\nKind regards,\nJane",
+        ["disclaimer"],
+    ),
+    (
+        "disclaimer with several legal phrases after the sign-off",
+        "Hi,\n\nPlease see attached.\n\nThanks,\nJane\n\n"
+        "This e-mail is confidential. If you have received this email in error please notify the sender.",
+        "Hi,\n\nPlease see attached.\n\nThanks,\nJane",
+        ["disclaimer"],
+    ),
+    (
+        "'-- ' signature",
+        "Hi,\n\nSee below.\n\n-- \nJane Doe\nAcme Ltd",
+        "Hi,\n\nSee below.",
+        ["signature"],
+    ),
+    (
+        "quoted reply thread",
+        "Sounds good, thanks.\n\nOn Mon, 3 Mar 2025 at 10:00, Bob <bob@example.com> wrote:\n> Can we meet?",
+        "Sounds good, thanks.",
+        ["quoted"],
+    ),
+]
+
+
+def main():
+    ok = True
+    for name, email, expected_body, expected_stripped in CASES:
+        result = preprocess_email(email)
+        passed = result.body == expected_body and result.stats()["stripped"] == expected_stripped
+        ok &= passed
+        print(f"{'✅' if passed else '❌'} {name}")
+        if not passed:
+            print(f"   body:     {result.body!r}")
+            print(f"   stripped: {result.stats()['stripped']}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
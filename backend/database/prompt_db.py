@@ -3,8 +3,11 @@ import sqlite3
 import os
 
 class PromptDatabase:
-    def __init__(self, db_path="prompts.db"):
+    def __init__(self, db_path="prompts.db", query_timer=None):
         self.db_path = db_path
+        # Optional callable taking the SQL text and returning a context manager that wraps
+        # the query, e.g. for per-request profiling. None disables timing.
+        self.query_timer = query_timer
         # Ensure the database directory exists, assuming db_path might contain directories
         db_dir = os.path.dirname(self.db_path)
         if db_dir and not os.path.exists(db_dir):
@@ -34,6 +37,12 @@ class PromptDatabase:
         return False
 
     def _execute_query(self, query, params=(), fetchone=False, fetchall=False, commit=False):
+        if self.query_timer is not None:
+            with self.query_timer(query):
+                return self._run_query(query, params, fetchone, fetchall, commit)
+        return self._run_query(query, params, fetchone, fetchall, commit)
+
+    def _run_query(self, query, params, fetchone, fetchall, commit):
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         try:
@@ -0,0 +1,67 @@
+# File: backend/deadlines.py
+# Per-request deadlines and client-disconnect cancellation for provider (LLM) calls.
+import asyncio
+import os
+import time
+
+DEADLINE_HEADER = "X-Request-Deadline"  # seconds, e.g. "20" to match a frontend axios timeout
+
+REWRITE_DEADLINE_SECONDS = float(os.getenv("REWRITE_DEADLINE_SECONDS", "30"))
+ANALYSIS_DEADLINE_SECONDS = float(os.getenv("ANALYSIS_DEADLINE_SECONDS", "180"))
+MAX_DEADLINE_SECONDS = float(os.getenv("MAX_DEADLINE_SECONDS", "300"))
+
+# Network timeouts applied to every provider call, independent of the request deadline.
+PROVIDER_CONNECT_TIMEOUT = float(os.getenv("PROVIDER_CONNECT_TIMEOUT", "5"))
+PROVIDER_READ_TIMEOUT = float(os.getenv("PROVIDER_READ_TIMEOUT", "120"))
+
+DISCONNECT_POLL_SECONDS = 0.25
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+def resolve_deadline(request, default_seconds):
+    """
+    Returns the absolute (monotonic) deadline for a request. The header can shorten or
+    lengthen the default, but never beyond MAX_DEADLINE_SECONDS.
+    """
+    seconds = default_seconds
+    header_value = request.headers.get(DEADLINE_HEADER)
+    if header_value:
+        try:
+            seconds = float(header_value)
+        except ValueError:
+            print(f"WARNING: Ignoring invalid {DEADLINE_HEADER} header: {header_value!r}")
+    seconds = max(0.0, min(seconds, MAX_DEADLINE_SECONDS))
+    return time.monotonic() + seconds
+
+
+def provider_timeout(deadline):
+    """Read timeout for a provider call: the configured read timeout, capped by what is left of the deadline."""
+    return max(0.1, min(PROVIDER_READ_TIMEOUT, deadline - time.monotonic()))
+
+
+async def run_with_deadline(coro, request, deadline):
+    """
+    Awaits `coro` while watching the deadline and the client connection.
+    The underlying task is cancelled (so the provider call is abandoned) if either fires.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded()
+            done, _ = await asyncio.wait({task}, timeout=min(DISCONNECT_POLL_SECONDS, remaining))
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
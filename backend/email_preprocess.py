@@ -0,0 +1,229 @@
+# File: backend/email_preprocess.py
+# Strips quoted reply chains, forwarded headers, signatures and legal disclaimers from an
+# email before it is embedded in a prompt, so they don't inflate input tokens. The stripped
+# parts are kept and re-attached to the rewritten output afterwards.
+#
+# Everything here is a single pass over the lines with precompiled regexes, cheap enough to
+# run on every request.
+import re
+
+# Markers that start a quoted thread; everything from the marker down is the thread.
+_REPLY_HEADER_RE = re.compile(r"^\s*On\s.{1,200}\swrote:\s*$", re.IGNORECASE)
+_THREAD_MARKER_RE = re.compile(
+    r"^\s*(?:-{2,}\s*Original Message\s*-{2,}"
+    r"|-{2,}\s*Forwarded message\s*-{2,}"
+    r"|Begin forwarded message:"
+    r"|_{10,})\s*$",
+    re.IGNORECASE
+)
+_HEADER_FROM_RE = re.compile(r"^\s*\*?From:\*?\s+\S", re.IGNORECASE)
+_HEADER_FIELD_RE = re.compile(r"^\s*\*?(?:Sent|Date|To|Subject|Cc):\*?\s", re.IGNORECASE)
+_QUOTED_LINE_RE = re.compile(r"^\s*>")
+
+# Signatures
+_SIG_DELIMITER_RE = re.compile(r"^--\s?$")
+_VALEDICTION_RE = re.compile(
+    r"^\s*(?:(?:kind|best|warm|warmest)\s+regards|regards|cheers|thanks|thank you|many thanks|"
+    r"best|best wishes|sincerely|yours sincerely|yours faithfully|yours truly|all the best)[,.!]?\s*$",
+    re.IGNORECASE
+)
+_MOBILE_SIG_RE = re.compile(r"^\s*Sent from my \w+", re.IGNORECASE)
+SIGNATURE_MAX_LINES = 10
+SIGNATURE_MAX_LINE_LENGTH = 80
+SENTENCE_MIN_WORDS = 6  # a line ending in '.' with this many words is prose, not a contact line
+
+# Disclaimers are only looked for in the trailing block after the sign-off or signature, and a
+# paragraph only counts with a strong marker or several of the weaker legal phrases together.
+_STRONG_DISCLAIMER_RE = re.compile(
+    r"CONFIDENTIALITY NOTICE|^\s*(?:LEGAL\s+)?DISCLAIMER\b|PRIVILEGED (?:AND|&) CONFIDENTIAL"
+    r"|please consider the environment before printing",
+    re.IGNORECASE | re.MULTILINE
+)
+_WEAK_DISCLAIMER_RES = [
+    re.compile(r"\b(?:confidential|privileged)\b", re.IGNORECASE),
+    re.compile(r"intended (?:solely |only )?for the (?:use of the )?(?:individual|addressee|named recipient|recipient)", re.IGNORECASE),
+    re.compile(r"if you have received this (?:e-?mail|message|communication) in error", re.IGNORECASE),
+    re.compile(r"notify the sender|delete (?:this|it|the)\b", re.IGNORECASE),
+    re.compile(r"\b(?:disclosure|dissemination|distribution|copying)\b.{0,60}\bprohibited\b", re.IGNORECASE),
+]
+DISCLAIMER_MIN_WEAK_MATCHES = 2
+DISCLAIMER_MAX_LINES = 20
+
+
+class PreprocessedEmail:
+    def __init__(self, original, body, signature="", disclaimer="", quoted=""):
+        self.original = original
+        self.body = body
+        self.signature = signature
+        self.disclaimer = disclaimer
+        self.quoted = quoted
+
+    @property
+    def removed_chars(self):
+        return len(self.original) - len(self.body)
+
+    def stats(self):
+        return {
+            "removed_chars": self.removed_chars,
+            "stripped": [name for name in ("quoted", "disclaimer", "signature") if getattr(self, name)],
+        }
+
+
+def _find_thread_start(lines):
+    # Index from which every remaining line is "> " quoted or blank (computed once, backwards)
+    quoted_tail_start = len(lines)
+    while quoted_tail_start > 0 and (_QUOTED_LINE_RE.match(lines[quoted_tail_start - 1]) or not lines[quoted_tail_start - 1].strip()):
+        quoted_tail_start -= 1
+
+    for i, line in enumerate(lines):
+        if _THREAD_MARKER_RE.match(line):
+            return i
+        if _REPLY_HEADER_RE.match(line):
+            return i
+        # "On Mon, 3 Mar 2025 at 10:00, Jane Doe <jane@example.com>\nwrote:" wrapped over two lines
+        if i + 1 < len(lines) and line.lstrip().lower().startswith("on ") and lines[i + 1].strip().lower().endswith("wrote:"):
+            if _REPLY_HEADER_RE.match(f"{line} {lines[i + 1]}"):
+                return i
+        # Outlook-style header block: From: followed closely by Sent:/Date:/To:/Subject:
+        if _HEADER_FROM_RE.match(line) and any(_HEADER_FIELD_RE.match(l) for l in lines[i + 1:i + 4]):
+            return i
+        # Trailing block of "> " quoted lines
+        if i >= quoted_tail_start and _QUOTED_LINE_RE.match(line):
+            return i
+    return None
+
+
+def _is_disclaimer(paragraph):
+    if _STRONG_DISCLAIMER_RE.search(paragraph):
+        return True
+    return sum(1 for r in _WEAK_DISCLAIMER_RES if r.search(paragraph)) >= DISCLAIMER_MIN_WEAK_MATCHES
+
+
+def _is_contact_line(line):
+    # Names, titles, phone numbers and addresses are short and aren't questions or sentences.
+    stripped = line.strip()
+    if len(stripped) > SIGNATURE_MAX_LINE_LENGTH or stripped.endswith("?"):
+        return False
+    return not (stripped.endswith(".") and len(stripped.split()) >= SENTENCE_MIN_WORDS)
+
+
+def _signoff_name_line(lines, i):
+    """
+    If the valediction at `i` really is the sign-off, returns the index of the name line under it
+    (or len(lines) if there is none). A valediction only counts if nothing but a short name or
+    contact block follows it, up to the end of the email, a '-- ' signature or a disclaimer;
+    "Thanks!" followed by the actual request is just part of the email. Returns None otherwise.
+    """
+    j = i + 1
+    while j < len(lines) and not lines[j].strip():
+        j += 1  # "Best,\n\nJane"
+    name_line = j
+    while j < len(lines) and lines[j].strip() and not _SIG_DELIMITER_RE.match(lines[j]):
+        if not _is_contact_line(lines[j]) or j - name_line >= SIGNATURE_MAX_LINES:
+            return None
+        j += 1
+
+    rest = [l for l in lines[j:] if l.strip()]
+    if not rest or _SIG_DELIMITER_RE.match(rest[0]):
+        return name_line
+    next_paragraph = []
+    for line in lines[j:]:
+        if line.strip():
+            next_paragraph.append(line)
+        elif next_paragraph:
+            break
+    return name_line if _is_disclaimer("\n".join(next_paragraph)) else None
+
+
+def _find_signoff(lines):
+    """Index of the last '-- ' delimiter or sign-off valediction near the end of the email, or None."""
+    tail_start = max(0, len(lines) - SIGNATURE_MAX_LINES - DISCLAIMER_MAX_LINES - 2)
+    for i in range(len(lines) - 1, tail_start - 1, -1):
+        if _SIG_DELIMITER_RE.match(lines[i]):
+            return i
+        if _VALEDICTION_RE.match(lines[i]):
+            return i if _signoff_name_line(lines, i) is not None else None
+    return None
+
+
+def _find_disclaimer_start(lines):
+    signoff = _find_signoff(lines)
+    if signoff is None:
+        return None
+    paragraph = []
+    for i in range(signoff + 1, len(lines) + 1):
+        if i < len(lines) and lines[i].strip():
+            paragraph.append(i)
+            continue
+        if paragraph and _is_disclaimer("\n".join(lines[j] for j in paragraph)):
+            return paragraph[0]
+        paragraph = []
+    return None
+
+
+def _looks_like_signature(block):
+    block = [l for l in block if l.strip()]
+    return bool(block) and len(block) <= SIGNATURE_MAX_LINES and all(len(l) <= SIGNATURE_MAX_LINE_LENGTH for l in block)
+
+
+def _find_signature_start(lines):
+    """Returns the index where the signature block starts, or None."""
+    tail_start = max(0, len(lines) - SIGNATURE_MAX_LINES - 2)
+    for i in range(len(lines) - 1, tail_start - 1, -1):
+        if _SIG_DELIMITER_RE.match(lines[i]):
+            return i if _looks_like_signature(lines[i + 1:]) else None
+
+    for i in range(len(lines) - 1, tail_start - 1, -1):
+        if _VALEDICTION_RE.match(lines[i]):
+            # Keep the sign-off and the sender's name in the body so the rewrite can sign off
+            # naturally; strip the contact block (title, phone, address...) underneath.
+            name_line = _signoff_name_line(lines, i)
+            if name_line is None:
+                return None
+            start = name_line + 1
+            return start if _looks_like_signature(lines[start:]) else None
+    return None
+
+
+def preprocess_email(text):
+    lines = text.replace("\r\n", "\n").split("\n")
+    quoted = disclaimer = signature = ""
+
+    thread_start = _find_thread_start(lines)
+    # A bare forward/quote with nothing above it is what the user wants rewritten, so leave it alone.
+    if thread_start is not None and any(l.strip() for l in lines[:thread_start]):
+        quoted = "\n".join(lines[thread_start:]).strip()
+        lines = lines[:thread_start]
+
+    disclaimer_start = _find_disclaimer_start(lines)
+    if disclaimer_start is not None and any(l.strip() for l in lines[:disclaimer_start]):
+        disclaimer = "\n".join(lines[disclaimer_start:]).strip()
+        lines = lines[:disclaimer_start]
+
+    # Mobile client footers carry no content
+    while lines and (not lines[-1].strip() or _MOBILE_SIG_RE.match(lines[-1])):
+        lines.pop()
+
+    signature_start = _find_signature_start(lines)
+    if signature_start is not None and any(l.strip() for l in lines[:signature_start]):
+        signature = "\n".join(lines[signature_start:]).strip()
+        if _SIG_DELIMITER_RE.match(lines[signature_start]):
+            signature = "-- \n" + "\n".join(lines[signature_start + 1:]).strip()
+        lines = lines[:signature_start]
+
+    return PreprocessedEmail(text, "\n".join(lines).strip(), signature, disclaimer, quoted)
+
+
+def reattach(rewritten, preprocessed):
+    """Appends the stripped signature, disclaimer and quoted thread after the rewritten email."""
+    parts = [rewritten.rstrip()]
+    if preprocessed.signature:
+        first_line = preprocessed.signature.lstrip("- \n").split("\n", 1)[0].strip()
+        # Skip it if the model already carried the signature over
+        if not first_line or first_line not in rewritten:
+            parts.append(preprocessed.signature)
+    if preprocessed.disclaimer:
+        parts.append(preprocessed.disclaimer)
+    if preprocessed.quoted:
+        parts.append(preprocessed.quoted)
+    return "\n\n".join(parts) if len(parts) > 1 else rewritten
@@ -0,0 +1,170 @@
+# File: backend/history_stats.py
+# Incrementally maintained usage aggregates for the rewrite history.
+#
+# Counters are updated as each rewrite is logged (and on each failed rewrite), and kept in
+# a small JSON file next to rewrite_history.json. Reading them never touches the history
+# log, so /history/stats costs the same however long the history gets.
+#
+# Rebuild from the raw log (e.g. after editing rewrite_history.json by hand):
+#   python history_stats.py --rebuild
+import argparse
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+FAILURE_REASONS = ("error", "deadline", "overloaded")
+
+
+def _empty_bucket():
+    return {"rewrites": 0, "reused": 0, "input_chars": 0, "output_chars": 0,
+            "failures": {reason: 0 for reason in FAILURE_REASONS}}
+
+
+def _derive(bucket):
+    """Adds averages and failure rate to a raw counter bucket."""
+    failures = sum(bucket["failures"].values())
+    attempts = bucket["rewrites"] + failures
+    return {
+        **bucket,
+        "avg_input_chars": round(bucket["input_chars"] / bucket["rewrites"], 1) if bucket["rewrites"] else 0,
+        "avg_output_chars": round(bucket["output_chars"] / bucket["rewrites"], 1) if bucket["rewrites"] else 0,
+        "failure_count": failures,
+        "failure_rate": round(failures / attempts, 4) if attempts else 0,
+    }
+
+
+class HistoryStats:
+    def __init__(self, stats_path="rewrite_stats.json"):
+        self.stats_path = Path(stats_path)
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._data = self._load()
+
+    def _file_mtime(self):
+        try:
+            return self.stats_path.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self):
+        self._mtime = self._file_mtime()
+        if self.stats_path.exists():
+            try:
+                return json.loads(self.stats_path.read_text(encoding="utf-8"))
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"WARNING: Could not read {self.stats_path}: {e}. Run 'python history_stats.py --rebuild'.")
+        return {"updated_at": None, "days": {}}
+
+    def _save(self):
+        self._data["updated_at"] = datetime.utcnow().isoformat()
+        tmp_path = self.stats_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._data, f)
+        os.replace(tmp_path, self.stats_path)
+        self._mtime = self._file_mtime()
+
+    def _refresh(self):
+        # Pick up changes made by another process (e.g. 'history_stats.py --rebuild' while the
+        # server is running) instead of overwriting them with the in-memory copy.
+        if self._file_mtime() != self._mtime:
+            self._data = self._load()
+
+    def _bucket(self, day, tone):
+        return self._data["days"].setdefault(day, {}).setdefault(tone or "unknown", _empty_bucket())
+
+    @staticmethod
+    def _day(timestamp):
+        return (timestamp or datetime.utcnow().isoformat())[:10]
+
+    def _apply_rewrite(self, entry):
+        bucket = self._bucket(self._day(entry.get("timestamp")), entry.get("tone"))
+        bucket["rewrites"] += 1
+        if entry.get("reused_similarity") is not None:
+            bucket["reused"] += 1
+        bucket["input_chars"] += len(entry.get("original_email") or "")
+        bucket["output_chars"] += len(entry.get("gemini_response") or "")
+
+    def record_rewrite(self, entry):
+        """Call with each history entry as it is appended to rewrite_history.json."""
+        with self._lock:
+            self._refresh()
+            self._apply_rewrite(entry)
+            self._save()
+
+    def record_failure(self, tone, reason="error"):
+        with self._lock:
+            self._refresh()
+            self._bucket(self._day(None), tone)["failures"][reason] += 1
+            self._save()
+
+    def summary(self, days=None):
+        """
+        Per-day/per-tone and overall aggregates, optionally limited to the most recent `days` days.
+        Cost depends only on the number of days and tones, never on the history size.
+        """
+        with self._lock:
+            self._refresh()
+            day_keys = sorted(self._data["days"])
+            if days:
+                day_keys = day_keys[-days:]
+            by_day = {day: {tone: dict(bucket, failures=dict(bucket["failures"]))
+                            for tone, bucket in self._data["days"][day].items()}
+                      for day in day_keys}
+            updated_at = self._data.get("updated_at")
+
+        by_tone, overall = {}, _empty_bucket()
+        for tones in by_day.values():
+            for tone, bucket in tones.items():
+                for target in (by_tone.setdefault(tone, _empty_bucket()), overall):
+                    for key in ("rewrites", "reused", "input_chars", "output_chars"):
+                        target[key] += bucket[key]
+                    for reason, count in bucket["failures"].items():
+                        target["failures"][reason] = target["failures"].get(reason, 0) + count
+
+        return {
+            "updated_at": updated_at,
+            "overall": _derive(overall),
+            "by_tone": {tone: _derive(bucket) for tone, bucket in sorted(by_tone.items())},
+            "by_day": {day: {tone: _derive(bucket) for tone, bucket in sorted(tones.items())}
+                       for day, tones in by_day.items()},
+        }
+
+    def rebuild(self, log_path):
+        """
+        Recomputes rewrite counters from the raw history log. Failed rewrites are never written
+        to the log, so their counters are carried over from the current stats file.
+        """
+        log_path = Path(log_path)
+        entries = []
+        if log_path.exists():
+            content = log_path.read_text(encoding="utf-8")
+            entries = json.loads(content) if content.strip() else []
+
+        with self._lock:
+            self._refresh()
+            old_days = self._data.get("days", {})
+            self._data = {"updated_at": None, "days": {}}
+            for day, tones in old_days.items():
+                for tone, bucket in tones.items():
+                    if any(bucket.get("failures", {}).values()):
+                        self._bucket(day, tone)["failures"] = dict(bucket["failures"])
+            for entry in entries:
+                self._apply_rewrite(entry)
+            self._save()
+        return len(entries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rewrite history aggregates.")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute the aggregates from the raw history log")
+    parser.add_argument("--log", default="rewrite_history.json", help="Path to rewrite_history.json")
+    parser.add_argument("--stats", default="rewrite_stats.json", help="Path to the aggregates file")
+    args = parser.parse_args()
+
+    stats = HistoryStats(args.stats)
+    if args.rebuild:
+        count = stats.rebuild(args.log)
+        print(f"Rebuilt {args.stats} from {count} history entries in {args.log}.")
+    print(json.dumps(stats.summary()["overall"], indent=2))
@@ -0,0 +1,226 @@
+# File: backend/profiling.py
+# Opt-in per-request profiling: a cProfile trace plus timing spans for SQLite queries,
+# history log I/O, prompt building and provider calls. Profiles are kept in a bounded
+# on-disk ring and served through the /admin/profiles endpoints.
+import contextvars
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from starlette.requests import Request
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+PROFILE_HEADER = "X-Profile"  # "1" together with a valid X-Admin-Token profiles that request
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # 0.0-1.0 of all requests
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "profiles"))
+PROFILE_RING_SIZE = int(os.getenv("PROFILE_RING_SIZE", "50"))
+
+_PROFILE_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+_current_profile = contextvars.ContextVar("current_profile", default=None)
+
+# Only one cProfile trace can run at a time (and it sees the whole event loop thread),
+# so concurrent profiled requests still record spans but skip the trace.
+_cprofile_lock = threading.Lock()
+
+
+class RequestProfile:
+    def __init__(self, method, path, reason):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.timestamp = datetime.utcnow().isoformat()
+        self.started = time.perf_counter()
+        self.duration_ms = None
+        self.status_code = None
+        self.spans = []
+        self.profiler = None
+
+    def add_span(self, name, started, attrs):
+        self.spans.append({
+            "name": name,
+            "start_ms": round((started - self.started) * 1000, 3),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            **attrs,
+        })
+
+    def summary(self):
+        totals = {}
+        for s in self.spans:
+            totals[s["name"]] = round(totals.get(s["name"], 0.0) + s["duration_ms"], 3)
+        return {
+            "id": self.id,
+            "timestamp": self.timestamp,
+            "method": self.method,
+            "path": self.path,
+            "reason": self.reason,
+            "status_code": self.status_code,
+            "duration_ms": self.duration_ms,
+            "span_totals_ms": totals,
+            "has_cprofile": self.profiler is not None,
+        }
+
+
+def is_admin(request):
+    token = request.headers.get(ADMIN_TOKEN_HEADER) or ""
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
+
+
+def profile_reason(request):
+    """Returns why this request should be profiled ('admin' or 'sampled'), or None."""
+    if request.headers.get(PROFILE_HEADER) == "1" and is_admin(request):
+        return "admin"
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return "sampled"
+    return None
+
+
+@contextmanager
+def profile_request(method, path, reason):
+    profile = RequestProfile(method, path, reason)
+    token = _current_profile.set(profile)
+    use_cprofile = _cprofile_lock.acquire(blocking=False)
+    if use_cprofile:
+        profile.profiler = cProfile.Profile()
+        profile.profiler.enable()
+    try:
+        yield profile
+    finally:
+        if use_cprofile:
+            profile.profiler.disable()
+            _cprofile_lock.release()
+        profile.duration_ms = round((time.perf_counter() - profile.started) * 1000, 3)
+        _current_profile.reset(token)
+        try:
+            store.save(profile)
+        except OSError as e:
+            print(f"WARNING: Could not save profile {profile.id}: {e}")
+
+
+class ProfilingMiddleware:
+    """
+    Profiles admin-requested and sampled requests and adds the X-Profile-Id response header.
+
+    Plain ASGI middleware rather than @app.middleware("http"): BaseHTTPMiddleware sits between
+    the server and the endpoint's `receive`, so request.is_disconnected() never sees the client
+    going away and disconnect cancellation (deadlines.run_with_deadline) silently stops working.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith("/admin/"):
+            await self.app(scope, receive, send)
+            return
+        reason = profile_reason(Request(scope))
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+
+        final_message = None
+        with profile_request(scope["method"], scope["path"], reason) as profile:
+            async def send_with_profile_id(message):
+                nonlocal final_message
+                if message["type"] == "http.response.start":
+                    profile.status_code = message["status"]
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-profile-id", profile.id.encode("ascii")))
+                    message = {**message, "headers": headers}
+                elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                    # Held back until the profile is saved, so it can be fetched as soon as the response arrives
+                    final_message = message
+                    return
+                await send(message)
+
+            await self.app(scope, receive, send_with_profile_id)
+        if final_message is not None:
+            await send(final_message)
+
+
+@contextmanager
+def span(name, **attrs):
+    """Times a block when the current request is being profiled; a no-op otherwise."""
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_span(name, started, attrs)
+
+
+def record_span(name, started, **attrs):
+    """Records a span that started at `started` (time.perf_counter()) and ends now, for code that can't be wrapped in `span`."""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.add_span(name, started, attrs)
+
+
+def sql_span(query):
+    # Used as PromptDatabase.query_timer
+    return span("sqlite", query=" ".join(query.split())[:120])
+
+
+class ProfileStore:
+    """Keeps the newest `ring_size` profiles on disk as <id>.json (summary + spans) and <id>.prof (pstats)."""
+
+    def __init__(self, directory, ring_size):
+        self.directory = Path(directory)
+        self.ring_size = ring_size
+        self._lock = threading.Lock()
+
+    def save(self, profile):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        record = profile.summary()
+        record["spans"] = profile.spans
+        if profile.profiler is not None:
+            profile.profiler.dump_stats(str(self.directory / f"{profile.id}.prof"))
+            text = io.StringIO()
+            pstats.Stats(profile.profiler, stream=text).sort_stats("cumulative").print_stats(30)
+            record["top_functions"] = text.getvalue()
+        with self._lock:
+            (self.directory / f"{profile.id}.json").write_text(json.dumps(record, indent=2), encoding="utf-8")
+            self._trim()
+
+    def _trim(self):
+        summaries = sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        for old in summaries[:max(0, len(summaries) - self.ring_size)]:
+            old.unlink(missing_ok=True)
+            old.with_suffix(".prof").unlink(missing_ok=True)
+
+    def list(self):
+        results = []
+        for path in sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True):
+            try:
+                record = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, json.JSONDecodeError):
+                continue
+            record.pop("spans", None)
+            record.pop("top_functions", None)
+            results.append(record)
+        return results
+
+    def path_for(self, profile_id, kind):
+        """Returns the path of a stored profile file ('json' or 'prof'), or None if it doesn't exist."""
+        if not _PROFILE_ID_RE.match(profile_id) or kind not in ("json", "prof"):
+            return None
+        path = self.directory / f"{profile_id}.{kind}"
+        return path if path.exists() else None
+
+
+store = ProfileStore(PROFILE_DIR, PROFILE_RING_SIZE)
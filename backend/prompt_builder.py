@@ -0,0 +1,131 @@
+# File: backend/prompt_builder.py
+# Prompt construction and response parsing for the /rewrite endpoint.
+# Kept separate from app_fastapi.py so other entry points can build exactly the same prompts.
+import re
+
+FALLBACK_BASE_PROMPT = "You are a helpful writing assistant. Please rewrite the provided email."
+
+RESPONSE_FORMAT = """ANALYSIS:
+[Your analysis here]
+
+SUBJECT:
+[Your subject line here]
+
+REWRITTEN EMAIL:
+[Your rewritten email here]"""
+
+_SECTION_RE = re.compile(
+    r"ANALYSIS:\s*(?P<analysis>.*?)\s*SUBJECT:\s*(?P<subject>.*?)\s*REWRITTEN EMAIL:\s*(?P<rewritten>.*)",
+    re.DOTALL
+)
+# Tone markers are matched case-insensitively and may be wrapped in markdown (**, ##, `, >).
+_MARKDOWN = r"[ \t>#*_`]*"
+_TONE_START = rf"^{_MARKDOWN}={{2,}}[ \t]*TONE[ \t]*:[ \t]*(?P<tone>[^\n]+?)[ \t]*={{2,}}{_MARKDOWN}$"
+_TONE_END = rf"^{_MARKDOWN}={{2,}}[ \t]*END[ \t]+TONE[ \t]*={{2,}}{_MARKDOWN}$"
+# A block ends at its END marker, or at the next block / end of text if the model dropped the marker.
+_TONE_BLOCK_RE = re.compile(
+    rf"{_TONE_START}(?P<body>.*?)(?:{_TONE_END}|(?={_TONE_START.replace('?P<tone>', '')})|\Z)",
+    re.DOTALL | re.MULTILINE | re.IGNORECASE
+)
+
+
+def tone_segment(tone, tone_details):
+    """Returns the tone guidance block for a tone, or an empty string if it has no instructions."""
+    if tone_details and tone_details.get('instructions'):
+        return f"Apply the following tone guidance for '{tone_details.get('label', tone)}':\n{tone_details['instructions']}\n\n"
+    return ""
+
+
+def draft_segment(draft, tone=None):
+    """
+    Returns the block that offers a prior rewrite of a near-duplicate email as a starting draft.
+    In multi-tone prompts `tone` names the tone the draft is for.
+    """
+    which = f'"{tone}" rewrite' if tone else "rewrite"
+    label = f" ({tone})" if tone else ""
+    return f"""A previous {which} of a very similar email is provided below as a starting draft. Reuse its structure and wording where it fits, but make sure every name, date, amount and other detail matches the original email above.
+
+--- DRAFT FROM SIMILAR EMAIL{label} ---
+{draft}
+--------------------------------
+
+"""
+
+
+def build_rewrite_prompt(base_prompt, tone, tone_details, email, draft=None):
+    """Builds the single-tone rewrite prompt sent to Gemini."""
+    return f"""{base_prompt}
+
+{tone_segment(tone, tone_details)}The user has submitted the following email and would like it rewritten in a "{tone}" tone. The original email is:
+
+--- ORIGINAL EMAIL ---
+{email}
+----------------------
+
+{draft_segment(draft) if draft else ""}Please complete the following tasks:
+
+1. Briefly analyze the tone and effectiveness of the original email (1–2 sentences) against the desired "{tone}" tone. This analysis should help the user understand areas for improvement in their original draft when aiming for this specific tone.
+2. Suggest a concise and fitting subject line for the rewritten email that reflects the "{tone}" tone.
+3. Rewrite the email in the specified "{tone}" tone, ensuring the core message and intent of the original email are preserved.
+
+Respond using the following exact format, including the labels ANALYSIS:, SUBJECT:, and REWRITTEN EMAIL: (do not add any other text or markdown like ```json or ```):
+
+{RESPONSE_FORMAT}
+    """
+
+
+def build_multi_tone_prompt(base_prompt, tones, email, drafts=None):
+    """
+    Builds one prompt asking for the same email in several tones.
+    `tones` is a list of (keyword, tone_details) pairs; tone_details may be None.
+    `drafts` optionally maps tone keywords to a starting draft for that tone.
+    """
+    tone_list = ", ".join(f'"{keyword}"' for keyword, _ in tones)
+    guidance = "".join(tone_segment(keyword, details) for keyword, details in tones)
+    blocks = "\n\n".join(f"=== TONE: {keyword} ===\n{RESPONSE_FORMAT}\n=== END TONE ===" for keyword, _ in tones)
+    draft_blocks = "".join(draft_segment(draft, tone=keyword) for keyword, draft in (drafts or {}).items())
+
+    return f"""{base_prompt}
+
+{guidance}The user has submitted the following email and would like it rewritten separately in each of these tones: {tone_list}. The original email is:
+
+--- ORIGINAL EMAIL ---
+{email}
+----------------------
+
+{draft_blocks}For EACH tone, complete the following tasks independently of the other tones:
+
+1. Briefly analyze the tone and effectiveness of the original email (1–2 sentences) against the desired tone. This analysis should help the user understand areas for improvement in their original draft when aiming for that specific tone.
+2. Suggest a concise and fitting subject line for the rewritten email that reflects the tone.
+3. Rewrite the email in that tone, ensuring the core message and intent of the original email are preserved.
+
+Respond with one block per tone, in the order listed, using the following exact format including the === TONE: ... === and === END TONE === markers and the labels ANALYSIS:, SUBJECT:, and REWRITTEN EMAIL: (do not add any other text or markdown like ```json or ```):
+
+{blocks}
+    """
+
+
+def parse_rewrite_response(text):
+    """Splits a response in RESPONSE_FORMAT into analysis/subject/rewritten_email. Missing sections are None."""
+    match = _SECTION_RE.search(text or "")
+    if not match:
+        return {"analysis": None, "subject": None, "rewritten_email": None}
+    return {
+        "analysis": match.group("analysis").strip(),
+        "subject": match.group("subject").strip(),
+        "rewritten_email": match.group("rewritten").strip(),
+    }
+
+
+def split_multi_tone_response(text, tones):
+    """Returns {tone_keyword: section_text} for every tone block found in a multi-tone response."""
+    wanted = {tone.lower(): tone for tone in tones}
+    sections = {}
+    for match in _TONE_BLOCK_RE.finditer(text or ""):
+        tone = wanted.get(match.group("tone").strip().strip("\"'*_`").strip().lower())
+        if tone and tone not in sections:
+            sections[tone] = match.group("body").strip()
+    if not sections and len(tones) == 1 and _SECTION_RE.search(text or ""):
+        # A single pending tone answered without the block markers
+        sections[tones[0]] = text.strip()
+    return sections
@@ -0,0 +1,65 @@
+# File: backend/provider_clients.py
+# Shared, pooled HTTP clients for provider and other outbound calls.
+#
+# openai==0.28 opens a fresh aiohttp session (and TLS handshake) per acreate() call, and a
+# fresh requests session per create() call, unless one is supplied. Here both are created
+# once and reused, with keep-alive and a bounded connection pool:
+#   - async: one aiohttp.ClientSession, created at app startup (it must live on the event loop)
+#   - sync:  one requests.Session, also used for any other outbound HTTP calls
+# Gemini already goes over a single long-lived gRPC channel (HTTP/2, multiplexed) that
+# google-generativeai creates once per process; it is configured here so that is explicit.
+import os
+
+import aiohttp
+import google.generativeai as genai
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+
+PROVIDER_POOL_SIZE = int(os.getenv("PROVIDER_POOL_SIZE", "20"))
+PROVIDER_KEEPALIVE_SECONDS = float(os.getenv("PROVIDER_KEEPALIVE_SECONDS", "60"))
+
+_aio_session = None
+
+
+def _build_http_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=PROVIDER_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Sync pooled session: shared with openai's sync API and available for other outbound calls.
+http_session = _build_http_session()
+openai.requestssession = http_session
+
+
+def configure_gemini(api_key):
+    # gRPC transport: one HTTP/2 channel per process, reused for every (sync and async) call.
+    genai.configure(api_key=api_key, transport="grpc")
+
+
+async def startup():
+    global _aio_session
+    if _aio_session is None or _aio_session.closed:
+        connector = aiohttp.TCPConnector(limit=PROVIDER_POOL_SIZE, keepalive_timeout=PROVIDER_KEEPALIVE_SECONDS)
+        _aio_session = aiohttp.ClientSession(connector=connector)
+    print(f"Provider clients ready (pool size {PROVIDER_POOL_SIZE}, keep-alive {PROVIDER_KEEPALIVE_SECONDS}s).")
+
+
+async def shutdown():
+    global _aio_session
+    if _aio_session is not None:
+        await _aio_session.close()
+        _aio_session = None
+    http_session.close()
+
+
+async def chat_completion(**kwargs):
+    """openai.ChatCompletion.acreate over the shared aiohttp session."""
+    if _aio_session is None:
+        await startup()
+    # openai 0.28 reads the session from a ContextVar, so it is set in the calling task's context.
+    openai.aiosession.set(_aio_session)
+    return await openai.ChatCompletion.acreate(**kwargs)
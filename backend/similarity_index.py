@@ -0,0 +1,235 @@
+# File: backend/similarity_index.py
+# Local near-duplicate index over previously rewritten emails.
+# Uses MinHash signatures with banded LSH so templated emails (same body, different
+# names/dates/amounts) can be matched without calling any embedding service.
+#
+# Persistence is an append-only JSON-lines log: each add appends one line, and the file is
+# only rewritten (compacted) when trimmed or evicted entries make up most of it.
+import hashlib
+import json
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_NUMBER_RE = re.compile(r"\d+")
+# Numbers, dates, amounts and capitalised words (names, places): the details that digit
+# collapsing hides from the similarity score.
+_DETAIL_RE = re.compile(r"\d+(?:[.,:/-]\d+)*|\b[A-Z][\w'-]*")
+
+
+def prompt_version(base_prompt, tone_instructions):
+    """Short stable fingerprint of the prompt components a rewrite was produced with."""
+    digest = hashlib.sha1(f"{base_prompt or ''}\x00{tone_instructions or ''}".encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+def details_match(email_a, email_b):
+    """True if both emails mention exactly the same numbers, dates, amounts and names."""
+    return Counter(_DETAIL_RE.findall(email_a)) == Counter(_DETAIL_RE.findall(email_b))
+
+
+class SimilarityIndex:
+    def __init__(self, index_path="similarity_index.jsonl", num_perm=128, bands=32,
+                 shingle_size=3, max_entries_per_key=500, max_versions_per_tone=2):
+        if num_perm % bands != 0:
+            raise ValueError("num_perm must be divisible by bands")
+        self.index_path = Path(index_path)
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.max_entries_per_key = max_entries_per_key
+        # Older prompt versions of a tone can never match again (unless the prompt is reverted),
+        # so only the most recently used ones are kept.
+        self.max_versions_per_tone = max_versions_per_tone
+        # _lock guards the in-memory index (held briefly, also by lookups on the event loop);
+        # _file_lock serialises appends and compaction so neither loses the other's writes.
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._log_lines = 0
+
+        # Fixed seeds so signatures stay comparable across restarts.
+        seed_bytes = hashlib.sha256(b"email-rewriter-minhash").digest()
+        rng_state = int.from_bytes(seed_bytes, "big")
+        self._perms = []
+        for _ in range(num_perm):
+            rng_state = (rng_state * 6364136223846793005 + 1442695040888963407) % (1 << 64)
+            a = (rng_state >> 3) % (_MERSENNE_PRIME - 1) + 1
+            rng_state = (rng_state * 6364136223846793005 + 1442695040888963407) % (1 << 64)
+            b = (rng_state >> 3) % _MERSENNE_PRIME
+            self._perms.append((a, b))
+
+        # key -> list of entries; key -> band bucket -> list of entry positions
+        self._entries = {}
+        self._buckets = {}
+        self._load()
+
+    # --- Signatures ---
+
+    def _shingles(self, text):
+        # Digits are collapsed so invoice numbers, dates and amounts don't break matches.
+        tokens = _TOKEN_RE.findall(_NUMBER_RE.sub("0", text.lower()))
+        if len(tokens) < self.shingle_size:
+            return {" ".join(tokens)} if tokens else set()
+        return {" ".join(tokens[i:i + self.shingle_size]) for i in range(len(tokens) - self.shingle_size + 1)}
+
+    def signature(self, text):
+        hashed = [zlib.crc32(s.encode("utf-8")) for s in self._shingles(text)]
+        if not hashed:
+            return [_MAX_HASH] * self.num_perm
+        return [min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashed) for a, b in self._perms]
+
+    def _band_keys(self, signature):
+        return [f"{i}:{hash(tuple(signature[i * self.rows:(i + 1) * self.rows]))}" for i in range(self.bands)]
+
+    @staticmethod
+    def estimate_similarity(sig_a, sig_b):
+        if not sig_a or len(sig_a) != len(sig_b):
+            return 0.0
+        return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+    @staticmethod
+    def _key(tone, version):
+        return f"{tone}|{version}"
+
+    # --- Lookup / insert ---
+
+    def find_similar(self, email, tone, version, threshold, signature=None):
+        """
+        Returns (entry, similarity) for the closest prior rewrite above threshold, else (None, 0.0).
+        Pass a precomputed `signature` to avoid recomputing it (it is the expensive part).
+        """
+        key = self._key(tone, version)
+        with self._lock:
+            if not self._entries.get(key):
+                return None, 0.0
+        if signature is None:
+            signature = self.signature(email)
+        with self._lock:
+            entries = self._entries.get(key, [])
+            buckets = self._buckets.get(key, {})
+            candidates = set()
+            for band_key in self._band_keys(signature):
+                candidates.update(buckets.get(band_key, ()))
+
+            best_entry, best_score = None, 0.0
+            for pos in candidates:
+                entry = entries[pos]
+                score = self.estimate_similarity(signature, entry["signature"])
+                if score > best_score:
+                    best_entry, best_score = entry, score
+
+        if best_entry is not None and best_score >= threshold:
+            return best_entry, best_score
+        return None, 0.0
+
+    def add(self, email, tone, version, rewritten, signature=None):
+        """Indexes a rewrite. Blocking (hashing and file I/O), so call it off the event loop."""
+        key = self._key(tone, version)
+        entry = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "original_email": email,
+            "rewritten": rewritten,
+            "signature": signature if signature is not None else self.signature(email),
+        }
+        with self._file_lock:
+            with self._lock:
+                self._insert(key, entry)
+                evicted = self._evict_stale_versions(tone, key)
+                live = sum(len(entries) for entries in self._entries.values())
+            if evicted or self._log_lines >= 2 * live + 100:
+                self._compact()
+            else:
+                self._append(key, entry)
+
+    def _insert(self, key, entry):
+        entries = self._entries.setdefault(key, [])
+        entries.append(entry)
+        if len(entries) > self.max_entries_per_key:
+            # Drop the oldest entries and rebuild buckets for this key.
+            del entries[:len(entries) - self.max_entries_per_key]
+            self._reindex_key(key)
+        else:
+            self._index_entry(key, len(entries) - 1, entry["signature"])
+
+    def _evict_stale_versions(self, tone, current_key):
+        """Drops all but the most recently used prompt versions of `tone`. Returns True if any were dropped."""
+        tone_keys = [k for k in self._entries if k.split("|", 1)[0] == tone]
+        if len(tone_keys) <= self.max_versions_per_tone:
+            return False
+        tone_keys.sort(key=lambda k: (k == current_key, self._entries[k][-1]["timestamp"]), reverse=True)
+        for stale_key in tone_keys[self.max_versions_per_tone:]:
+            self._entries.pop(stale_key, None)
+            self._buckets.pop(stale_key, None)
+        return True
+
+    def _index_entry(self, key, pos, signature):
+        buckets = self._buckets.setdefault(key, {})
+        for band_key in self._band_keys(signature):
+            buckets.setdefault(band_key, []).append(pos)
+
+    def _reindex_key(self, key):
+        self._buckets[key] = {}
+        for pos, entry in enumerate(self._entries.get(key, [])):
+            self._index_entry(key, pos, entry["signature"])
+
+    # --- Persistence ---
+
+    def _header(self):
+        return json.dumps({"num_perm": self.num_perm}) + "\n"
+
+    def _load(self):
+        if not self.index_path.exists():
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                header = json.loads(f.readline() or "{}")
+                if header.get("num_perm") != self.num_perm:
+                    print("INFO: Similarity index was built with different settings, starting empty.")
+                    return
+                for line in f:
+                    self._log_lines += 1
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # e.g. a line cut short by a crash mid-append
+                    key = record.pop("key")
+                    self._entries.setdefault(key, []).append(record)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"WARNING: Could not load similarity index from {self.index_path}: {e}. Starting empty.")
+            self._entries, self._log_lines = {}, 0
+            return
+        for key, entries in self._entries.items():
+            del entries[:max(0, len(entries) - self.max_entries_per_key)]
+            self._reindex_key(key)
+
+    def _append(self, key, entry):
+        is_new = not self.index_path.exists()
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            if is_new:
+                f.write(self._header())
+            f.write(json.dumps({"key": key, **entry}) + "\n")
+        self._log_lines += 1
+
+    def _compact(self):
+        """Rewrites the log with only the live entries."""
+        with self._lock:
+            snapshot = [(key, list(entries)) for key, entries in self._entries.items()]
+        tmp_path = self.index_path.with_suffix(".tmp")
+        lines = 0
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self._header())
+            for key, entries in snapshot:
+                for entry in entries:
+                    f.write(json.dumps({"key": key, **entry}) + "\n")
+                    lines += 1
+        os.replace(tmp_path, self.index_path)
+        self._log_lines = lines
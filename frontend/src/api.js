@@ -1,12 +1,17 @@
 import axios from 'axios';
 
 const BASE_API_URL = 'http://localhost:8000'; // Updated port and made it a base URL
+const REWRITE_TIMEOUT_MS = 30000;
 
 export const rewriteEmail = async (email, tone) => {
   try {
     const response = await axios.post(`${BASE_API_URL}/rewrite`, { // Use base URL + endpoint
       email,
       tone
+    }, {
+      timeout: REWRITE_TIMEOUT_MS,
+      // Tell the backend to give up at the same time we do, so it doesn't keep waiting on Gemini
+      headers: { 'X-Request-Deadline': String(REWRITE_TIMEOUT_MS / 1000) }
     });
     
     return response.data;